@@ -31,6 +31,10 @@ create or replace external function _ubiq_broker_fetch_dataset_and_structured_ke
     returns variant
     api_integration = ubiq_broker_int
     as 'https://ubiq-api-broker.azure-api.net/ubiq-api-broker/fetch_dataset_and_structured_key';
+create or replace external function _ubiq_broker_refresh_dataset_and_structured_key(dataset_name varchar, access_key_id varchar, secret_signing_key varchar, known_keys object)
+    returns variant
+    api_integration = ubiq_broker_int
+    as 'https://ubiq-api-broker.azure-api.net/ubiq-api-broker/fetch_dataset_and_structured_key';
 create or replace external function _ubiq_broker_submit_events(events variant, access_key_id varchar, secret_signing_key varchar)
     returns variant
     api_integration = ubiq_broker_int
@@ -45,6 +49,10 @@ create or replace external function _ubiq_broker_fetch_dataset_and_structured_ke
     returns variant
     api_integration = ubiq_broker_int
     as 'https://x02qdux9x9.execute-api.us-west-2.amazonaws.com/Production/fetch_dataset_and_structured_key';
+create or replace external function _ubiq_broker_refresh_dataset_and_structured_key(dataset_name varchar, access_key_id varchar, secret_signing_key varchar, known_keys object)
+    returns variant
+    api_integration = ubiq_broker_int
+    as 'https://x02qdux9x9.execute-api.us-west-2.amazonaws.com/Production/fetch_dataset_and_structured_key';
 create or replace external function _ubiq_broker_submit_events(events variant, access_key_id varchar, secret_signing_key varchar)
     returns variant
     api_integration = ubiq_broker_int
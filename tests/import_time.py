@@ -0,0 +1,70 @@
+import os
+import statistics
+import subprocess
+import sys
+
+# Measures the cold import time of each ubiq entry point with `python -X importtime`,
+# in a fresh interpreter each run, against a budget in milliseconds. Also checks
+# each entry point stays reachable as an attribute of its lazily importing
+# parent package, as the UDF handlers reach it.
+
+UDF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ubiq-udf')
+
+# Entry point: maximum allowed median import time in milliseconds. The budgets
+# can be overridden with the MAX_IMPORT_<ENTRY POINT> environment variables, eg
+# MAX_IMPORT_UBIQ_STRUCTURED_ENCRYPT_CACHE=100
+ENTRY_POINTS = {
+    # The packages themselves import nothing until a name is used
+    'ubiq': 20,
+    'ubiq.structured': 20,
+    # What the structured UDF handlers load
+    'ubiq.structured.encrypt_cache': 100,
+    'ubiq.structured.decrypt_cache': 100,
+    # What ubiq_begin_session and ubiq_refresh_session unwrap keys with
+    'ubiq.structured.common': 100,
+}
+
+RUNS = int(os.getenv('IMPORT_TIME_RUNS', '5'))
+
+def import_time(module):
+    # Returns the cumulative import time of the module in milliseconds
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=UDF_DIR, capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].rstrip() == f' {module}':
+            return int(fields[1]) / 1000
+    raise RuntimeError(f'No import time reported for {module}')
+
+def reachable(module):
+    # Tests whether the module is an attribute of its parent package when only
+    # the parent has been imported
+    if '.' not in module:
+        return True
+    parent, name = module.rsplit('.', 1)
+    result = subprocess.run(
+        [sys.executable, '-c', f'import {parent}; {parent}.{name}'],
+        cwd=UDF_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f'FAILED: {module} is not reachable as an attribute of {parent}')
+        print(result.stderr)
+        return False
+    return True
+
+def evaluate_threshold(threshold, reality, label):
+    if reality < threshold:
+        print(f'PASSED: {label} imported in {reality:.1f} of {threshold} allowed milliseconds')
+        return True
+    else:
+        print(f'FAILED: {label} imported in {reality:.1f}, exceeding {threshold} allowed milliseconds')
+        return False
+
+res = []
+for module, budget in ENTRY_POINTS.items():
+    budget = int(os.getenv('MAX_IMPORT_' + module.upper().replace('.', '_'), budget))
+    res.append(evaluate_threshold(budget, statistics.median(import_time(module) for _ in range(RUNS)), module))
+    res.append(reachable(module))
+
+sys.exit(0 if all(res) else 1)
@@ -41,7 +41,9 @@ def validate_signing_key(signing_key: Any) -> None:
         raise AttributeError("Secret signing key in request is malformed")
 
 
-def unpack_request(request: Any, expected_num_attributes: int) -> List[List[Any]]:
+def unpack_request(
+    request: Any, expected_num_attributes: int, optional_num_attributes: int = 0
+) -> List[List[Any]]:
     """
     Unpacks, validates and returns the request contents.
 
@@ -49,6 +51,9 @@ def unpack_request(request: Any, expected_num_attributes: int) -> List[List[Any]
         request: content of the REST request
         expected_num_attributes: expected number of attributes for each row
             in the request body
+        optional_num_attributes: number of trailing attributes a row may
+            additionally carry (e.g., when several external functions share
+            an endpoint)
 
     Returns:
         List of request rows, with each row containing one or more request
@@ -72,7 +77,11 @@ def unpack_request(request: Any, expected_num_attributes: int) -> List[List[Any]
         # Note that the first entry in each request should be an integer row index
         if (
             not isinstance(entry, list)
-            or len(entry) != expected_num_attributes
+            or not (
+                expected_num_attributes
+                <= len(entry)
+                <= expected_num_attributes + optional_num_attributes
+            )
             or not isinstance(entry[0], int)
         ):
             raise AttributeError(
@@ -118,6 +127,36 @@ def parse_ubiq_response(
     return contents
 
 
+def trim_known_keys(
+    contents: Dict[str, Any], known_keys: Dict[str, int]
+) -> Dict[str, Any]:
+    """
+    Replaces the wrapped keys a caller already holds with nulls, leaving each
+    remaining key at its key number, so a session refresh only transfers (and
+    unwraps) new key generations.
+
+    Args:
+        contents: parsed Ubiq API def_keys response, keyed by dataset name
+        known_keys: number of keys the caller holds, keyed by dataset name
+
+    Returns:
+        A copy of the response contents with the known keys removed; the
+        contents themselves may be shared by other rows and are not modified.
+    """
+    contents = dict(contents)
+    for dataset_name, key_count in known_keys.items():
+        if dataset_name in contents:
+            contents[dataset_name] = {
+                **contents[dataset_name],
+                "keys": [
+                    None if key_number < key_count else key
+                    for key_number, key in enumerate(contents[dataset_name]["keys"])
+                ],
+            }
+
+    return contents
+
+
 def format_error_response(error_msg: str) -> str:
     """
     Wraps error message in list which is assigned as a value of key "data,"
@@ -0,0 +1,59 @@
+import os
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Tuple
+
+# Rows of a request processed at once, each blocking on its own upstream call
+BROKER_MAX_WORKERS = int(os.getenv("UBIQ_BROKER_MAX_WORKERS", "8"))
+
+# Seconds allowed to process all rows of a request, short of the API gateway's
+# own integration timeout
+BROKER_DEADLINE = float(os.getenv("UBIQ_BROKER_DEADLINE", "25"))
+
+# Set singleton instance, shared across invocations of a warm instance
+executor = ThreadPoolExecutor(
+    max_workers=BROKER_MAX_WORKERS, thread_name_prefix="ubiq-broker"
+)
+
+
+def map_rows(
+    process_row: Callable[[List[Any]], Any],
+    rows: List[List[Any]],
+    deadline: float = BROKER_DEADLINE,
+) -> List[Tuple[int, Any]]:
+    """
+    Processes the rows of a request concurrently, so a request takes about as
+    long as its slowest row rather than the sum of all rows.
+
+    Args:
+        process_row: called with each request row, returning its result
+        rows: request rows, as returned by unpack_request
+        deadline: seconds allowed for all rows to complete
+
+    Returns:
+        List of each row's index and result, in request order.
+
+    Raises:
+        The exception of the first row that failed, or TimeoutError when the
+        rows do not complete within the deadline.
+    """
+    # A single row is processed without a hand-off to the pool
+    if len(rows) == 1:
+        return [(rows[0][0], process_row(rows[0]))]
+
+    futures = [executor.submit(process_row, row) for row in rows]
+    done, pending = wait(futures, timeout=deadline, return_when=FIRST_EXCEPTION)
+
+    for future in futures:
+        if future in done and future.exception() is not None:
+            for other in pending:
+                other.cancel()
+            raise future.exception()
+
+    if pending:
+        for future in pending:
+            future.cancel()
+        raise TimeoutError(
+            f"Request rows did not complete within {deadline} seconds"
+        )
+
+    return [(row[0], future.result()) for row, future in zip(rows, futures)]
@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+# Entries held in memory by a broker instance, and seconds each is held
+LOCAL_CACHE_SIZE = int(os.getenv("UBIQ_LOCAL_CACHE_SIZE", "1000"))
+LOCAL_CACHE_TTL = float(os.getenv("UBIQ_LOCAL_CACHE_TTL", "10"))
+
+
+class LocalCache:
+    """
+    Bounded, least recently used in-memory cache with a time to live, holding
+    parsed values in front of the Redis cache so warm broker instances serve
+    hot entries without a network round trip.
+    """
+
+    def __init__(self, max_entries: int = LOCAL_CACHE_SIZE, ttl: float = LOCAL_CACHE_TTL) -> None:
+        """
+        Args:
+            max_entries: entries held before the least recently used is evicted
+            ttl: seconds an entry is held
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns the value cached under the key, or None if it is not cached or
+        has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Caches the value under the key, evicting the least recently used
+        entries beyond max_entries.
+        """
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Removes the entry cached under the key, if any.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Removes every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
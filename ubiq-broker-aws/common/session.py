@@ -0,0 +1,52 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connections to the Ubiq API kept alive for reuse by later invocations
+HTTP_POOL_SIZE = int(os.getenv("UBIQ_HTTP_POOL_SIZE", "10"))
+
+# Seconds allowed to establish a connection and to wait for a response
+HTTP_CONNECT_TIMEOUT = float(os.getenv("UBIQ_HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("UBIQ_HTTP_READ_TIMEOUT", "10"))
+
+# Retries of failed connections, and of GET requests answered with a
+# gateway error
+HTTP_RETRIES = int(os.getenv("UBIQ_HTTP_RETRIES", "2"))
+
+
+class UbiqSession(requests.Session):
+    """
+    HTTP session for calls to the Ubiq API, applying the configured timeouts to
+    every request that does not set its own.
+    """
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+def create_session() -> requests.Session:
+    """
+    Creates an HTTP session with a bounded pool of keep-alive connections and
+    retries, so warm invocations skip the DNS, TCP and TLS handshakes.
+
+    Returns:
+        The configured session.
+    """
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = UbiqSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Set singleton instance, shared across invocations of a warm instance
+ubiq_session = create_session()
@@ -48,6 +48,10 @@ do
     (cd $package_dir; zip -r ../${fn}_deploy.zip .)
     (cd $fn; zip -r ../${fn}_deploy.zip .)
     zip -r ${fn}_deploy.zip common
+    # Redis caching is enabled by deploying its configuration
+    if [ -f redis.json ]; then
+        zip ${fn}_deploy.zip redis.json
+    fi
 
     # Check if function exists
     aws lambda get-function --function-name $fn --region $aws_region --profile $aws_profile > /dev/null 2>&1
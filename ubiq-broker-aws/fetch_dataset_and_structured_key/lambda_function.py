@@ -1,16 +1,80 @@
 import logging
-import requests
 import json
+from common.concurrency import map_rows
+from common.def_keys import cache_stats, fetch_def_keys
 from common import (
-    http_auth,
     format_error_response,
     unpack_request,
     validate_access_key,
     validate_signing_key,
-    parse_ubiq_response,
-    UBIQ_API_URL
+    trim_known_keys,
 )
 
+def validate_row(row):
+    """
+    Validates the dataset names, access key and signing key of a request row.
+
+    Args:
+        row: request row of index, dataset names, access key, signing key and
+            optionally the number of keys already held per dataset
+    """
+    idx, dataset_names, access_key, signing_key, *known_keys = row
+
+    # Validate dataset name
+    if not isinstance(dataset_names, str):
+        raise AttributeError("Field Format Specification in request is malformed")
+
+    # Validate access key and signing key format
+    validate_access_key(access_key)
+    validate_signing_key(signing_key)
+
+def fetch_request(row):
+    """
+    Retrieves the datasets and keys of a distinct request.
+
+    Args:
+        row: the request, followed by its dataset names, access key and
+            signing key
+    """
+    _, dataset_names, access_key, signing_key = row
+
+    logging.info(f"Fetching datasets [{dataset_names}] of fetch key request")
+
+    # Get the datasets and keys from the cache or the Ubiq API
+    return fetch_def_keys(dataset_names, access_key, signing_key)
+
+def fetch_rows(rows):
+    """
+    Retrieves the datasets and keys of every request row, fetching each
+    distinct combination of dataset names, access key and signing key once.
+
+    Args:
+        rows: request rows, as returned by unpack_request
+
+    Returns:
+        List of each row's index and response contents, in request order.
+    """
+    for row in rows:
+        validate_row(row)
+
+    # Identical requests in a batch, as sent when the broker function is
+    # evaluated over a result set, are only fetched once
+    distinct = list(dict.fromkeys(tuple(row[1:4]) for row in rows))
+    logging.info(f"Fetching [{len(distinct)}] distinct requests for [{len(rows)}] rows")
+    fetched = dict(map_rows(fetch_request, [[request, *request] for request in distinct]))
+
+    response_contents = []
+    for idx, dataset_names, access_key, signing_key, *known_keys in rows:
+        contents = fetched[(dataset_names, access_key, signing_key)]
+
+        # Only return key generations the caller does not already hold
+        if known_keys and known_keys[0]:
+            contents = trim_known_keys(contents, known_keys[0])
+
+        response_contents.append((idx, contents))
+
+    return response_contents
+
 def lambda_handler(event, context):
     logging.info("Received request to fetch datasets and structured keys")
 
@@ -31,57 +95,22 @@ def lambda_handler(event, context):
         return format_error_response(msg)
 
     try:
-        # Extract and validate each row within the request
-        rows = unpack_request(req_body, 4)
+        # Extract and validate each row within the request; ubiq_refresh_session
+        # additionally sends the number of keys it already holds per dataset
+        rows = unpack_request(req_body, 4, 1)
     except AttributeError as e:
         logging.exception(e)
         return format_error_response(str(e))
 
-    # List of response contents
-    response_contents = []
-    dataset_name_list = []
-
-    # Extract dataset name, access key ID and secret signing key and query Ubiq API
-    for idx, dataset_names, access_key, signing_key in rows:
-
-        logging.info(f"Processing row [{idx}] of fetch key request")
-
-        # Validate dataset name
-        if not isinstance(dataset_names, str):
-            msg = "Field Format Specification in request is malformed"
-            logging.error(msg)
-            return format_error_response(msg)
-
-        # Validate access key and signing key format
-        try:
-            validate_access_key(access_key)
-            validate_signing_key(signing_key)
-        except AttributeError as e:
-            logging.exception(e)
-            return format_error_response(str(e))
-
-        try:
-            # Call Ubiq API to get the key
-            ubiq_response = requests.get(
-                url=f"{UBIQ_API_URL}/fpe/def_keys?ffs_name={dataset_names}&papi={access_key}",
-                auth=http_auth(access_key, signing_key),
-            )
-        except Exception as e:
-            msg = "An exception occurred while calling Ubiq API endpoint"
-            logging.exception(msg)
-            return format_error_response(msg)
-
-        try:
-            # Parse contents of Ubiq API response
-            contents = parse_ubiq_response(ubiq_response, dataset_names.split(','))
-        except Exception as e:
-            logging.exception(e)
-            return format_error_response(str(e))
-
-        response_contents.append(contents)
-    logging.info("Request to fetch encryption key successful")
+    try:
+        # Requests are fetched concurrently, each row answered at its own index
+        response_contents = fetch_rows(rows)
+    except Exception as e:
+        logging.exception(e)
+        return format_error_response(str(e))
+    logging.info(f"Request to fetch encryption key successful, cache statistics {cache_stats()}")
 
     return {
         "statusCode": 200, 
-        "body": json.dumps({"data": [[0, response_contents[0]]]})
+        "body": json.dumps({"data": [[idx, contents] for idx, contents in response_contents]})
         }
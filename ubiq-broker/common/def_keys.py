@@ -0,0 +1,421 @@
+import logging
+import os
+import requests
+import threading
+import time
+from typing import Any, Dict, List
+from . import UBIQ_API_URL, parse_ubiq_response
+from .auth import http_auth
+from .local_cache import LocalCache
+from .redis_handler import redis_client
+from .session import ubiq_session
+
+# Seconds a cached dataset is served as is; once older, it is still served
+# and refreshed from the Ubiq API after the response is sent
+DEF_KEYS_CACHE_TTL = int(os.getenv("UBIQ_DEF_KEYS_CACHE_TTL", "300"))
+
+# Whether stale datasets are served while they are refreshed. AWS Lambda
+# freezes an instance as soon as its handler returns, so there is no point at
+# which a refresh could run; on Lambda, stale datasets are fetched again
+# before answering instead.
+STALE_WHILE_REVALIDATE = "AWS_LAMBDA_FUNCTION_NAME" not in os.environ
+
+# Seconds a dataset stays cached in Redis at all
+DEF_KEYS_CACHE_MAX_AGE = int(os.getenv("UBIQ_DEF_KEYS_CACHE_MAX_AGE", "3600"))
+
+# Seconds a broker instance may hold the lock on fetching a def_keys response
+DEF_KEYS_LOCK_TTL = float(os.getenv("UBIQ_DEF_KEYS_LOCK_TTL", "15"))
+
+# Seconds other broker instances wait for the locked fetch before calling the
+# Ubiq API themselves, and how often they check the cache meanwhile
+DEF_KEYS_LOCK_WAIT = float(os.getenv("UBIQ_DEF_KEYS_LOCK_WAIT", "10"))
+DEF_KEYS_LOCK_POLL = 0.05
+
+# Ubiq API statuses that repeat until the request or its credentials change,
+# cached for DEF_KEYS_ERROR_TTL seconds; server errors are never cached
+DEF_KEYS_ERROR_STATUSES = (401, 403, 404)
+DEF_KEYS_ERROR_TTL = int(os.getenv("UBIQ_DEF_KEYS_ERROR_TTL", "30"))
+
+# Endpoint name the cached responses are stored under
+ENDPOINT_NAME = "fetch_dataset_and_structured_key"
+
+# Endpoint name the cached error responses are stored under
+ERROR_ENDPOINT_NAME = "fetch_dataset_and_structured_key_error"
+
+# Set singleton instance, holding cache entries in memory in front of Redis
+local_cache = LocalCache()
+
+# Stale datasets to refresh after the response is sent, as
+# (dataset names, access key, signing key)
+pending_refreshes = {}
+pending_refreshes_lock = threading.Lock()
+
+
+class UbiqResponseError(RuntimeError):
+    """
+    Raised when the Ubiq API answers with a status other than 200, carrying the
+    response so handlers can report its status code and text.
+    """
+
+    def __init__(self, response: requests.Response) -> None:
+        super().__init__(
+            f"An exception occurred while calling Ubiq Structured Encryption Key API endpoint ({response.status_code}): {response.text}"
+        )
+        self.response = response
+
+
+def fetch_def_keys(
+    dataset_names: str, access_key: str, signing_key: str
+) -> Dict[str, Any]:
+    """
+    Retrieves the dataset definitions and wrapped keys for the given datasets,
+    from the Redis cache when they are cached and otherwise from the Ubiq API,
+    caching the parsed response. Each dataset is cached on its own, so only
+    the datasets missing from the cache are requested from the Ubiq API, in a
+    single call. Concurrent misses across broker instances are coalesced into
+    a single call to the Ubiq API. Datasets cached for longer than
+    DEF_KEYS_CACHE_TTL are served from the cache and queued for
+    run_pending_refreshes, unless STALE_WHILE_REVALIDATE is off, in which case
+    they are fetched again like missing datasets. Authentication and not found errors from the Ubiq API are
+    cached briefly as well, and raised again without calling the Ubiq API.
+
+    Args:
+        dataset_names: comma separated Ubiq dataset names
+        access_key: the Ubiq API access key
+        signing_key: the Ubiq API secret signing key
+
+    Returns:
+        Parsed def_keys response, keyed by dataset name in the requested order.
+    """
+    names = list(dict.fromkeys(dataset_names.split(",")))
+
+    cached = servable(get_cached_def_keys(names, access_key, signing_key))
+    contents = {name: entry["contents"] for name, entry in cached.items()}
+
+    # Stale datasets are served as cached, so no caller waits on their refresh
+    stale = [name for name, entry in cached.items() if is_stale(entry)]
+    if stale:
+        queue_refresh(stale, access_key, signing_key)
+
+    missing = [name for name in names if name not in contents]
+    if not missing:
+        logging.info("Dataset and structured keys served from cache")
+        return {name: contents[name] for name in names}
+    missing_names = ",".join(missing)
+    raise_cached_error(missing_names, access_key, signing_key)
+
+    # Only one broker instance fetches missing datasets at a time; the others
+    # wait for them to be cached rather than all calling the Ubiq API at once
+    lock = def_keys_lock(missing_names, access_key, signing_key)
+    if lock is not None and not acquire_lock(lock):
+        fetched = wait_for_cached_def_keys(missing, access_key, signing_key, lock)
+        if fetched is not None:
+            logging.info("Dataset and structured keys served from cache after another fetch")
+            contents.update({name: entry["contents"] for name, entry in fetched.items()})
+            return {name: contents[name] for name in names}
+        # The other fetch may have failed with an error that was cached
+        raise_cached_error(missing_names, access_key, signing_key)
+        logging.warning("Fetching dataset and structured keys after waiting on another fetch")
+
+    try:
+        logging.info(f"Fetching [{len(missing)}] of [{len(names)}] datasets from the Ubiq API")
+        fetched = request_def_keys(missing_names, access_key, signing_key)
+        set_cached_def_keys(missing, access_key, signing_key, fetched)
+    except UbiqResponseError as e:
+        if e.response.status_code in DEF_KEYS_ERROR_STATUSES:
+            set_cached_error(missing_names, access_key, signing_key, e.response)
+        raise
+    finally:
+        if lock is not None:
+            release_lock(lock)
+
+    contents.update(fetched)
+    return {name: contents[name] for name in names}
+
+
+def request_def_keys(
+    dataset_names: str, access_key: str, signing_key: str
+) -> Dict[str, Any]:
+    """
+    Retrieves the dataset definitions and wrapped keys for the given datasets
+    from the Ubiq API.
+    """
+    # Call Ubiq API to get the key
+    ubiq_response = ubiq_session.get(
+        url=f"{UBIQ_API_URL}/fpe/def_keys?ffs_name={dataset_names}&papi={access_key}",
+        auth=http_auth(access_key, signing_key),
+    )
+    if ubiq_response.status_code != 200:
+        raise UbiqResponseError(ubiq_response)
+
+    return parse_ubiq_response(ubiq_response, dataset_names.split(","))
+
+
+def queue_refresh(names: List[str], access_key: str, signing_key: str) -> None:
+    """
+    Queues the given stale datasets to be refreshed by run_pending_refreshes.
+    """
+    with pending_refreshes_lock:
+        pending_refreshes[(",".join(names), access_key, signing_key)] = None
+
+
+def run_pending_refreshes() -> None:
+    """
+    Refreshes every queued stale dataset. Handlers schedule this to run after
+    their response is sent, on hosts that keep running once the invocation
+    has returned, so no caller waits on the refresh.
+    """
+    with pending_refreshes_lock:
+        refreshes = list(pending_refreshes)
+        pending_refreshes.clear()
+
+    for dataset_names, access_key, signing_key in refreshes:
+        refresh_def_keys(dataset_names.split(","), access_key, signing_key)
+
+
+def refresh_def_keys(names: List[str], access_key: str, signing_key: str) -> None:
+    """
+    Refreshes the cached definitions and keys of the given datasets from the
+    Ubiq API, unless another broker instance already is. Errors are logged
+    rather than raised, as the datasets have already been served.
+    """
+    lock = def_keys_lock(",".join(names), access_key, signing_key)
+    if lock is None or not acquire_lock(lock):
+        return
+
+    logging.info(f"Refreshing [{len(names)}] stale datasets")
+    try:
+        contents = request_def_keys(",".join(names), access_key, signing_key)
+        set_cached_def_keys(names, access_key, signing_key, contents)
+    except UbiqResponseError as e:
+        logging.exception("An exception occurred while refreshing dataset and structured keys")
+        if e.response.status_code in DEF_KEYS_ERROR_STATUSES:
+            # Revoked credentials or deleted datasets are no longer served
+            invalidate_cached_def_keys(names, access_key, signing_key)
+    except Exception:
+        logging.exception("An exception occurred while refreshing dataset and structured keys")
+    finally:
+        release_lock(lock)
+
+
+def is_stale(entry: Dict[str, Any]) -> bool:
+    """
+    Tests whether a cached dataset is older than DEF_KEYS_CACHE_TTL seconds.
+    """
+    return time.time() - entry["fetched_at"] >= DEF_KEYS_CACHE_TTL
+
+
+def servable(entries: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the cache entries that may be served: all of them when
+    STALE_WHILE_REVALIDATE is on, and only those that are not stale otherwise.
+    """
+    if STALE_WHILE_REVALIDATE:
+        return entries
+
+    return {name: entry for name, entry in entries.items() if not is_stale(entry)}
+
+
+def def_keys_lock(dataset_names: str, access_key: str, signing_key: str) -> Any:
+    """
+    Returns the lock guarding fetches of a def_keys response from the Ubiq API,
+    or None when no cache is configured.
+    """
+    if redis_client is None:
+        return None
+
+    return redis_client.lock(
+        access_key, signing_key, ENDPOINT_NAME, dataset_names, timeout=DEF_KEYS_LOCK_TTL
+    )
+
+
+def acquire_lock(lock: Any) -> bool:
+    """
+    Takes the lock without waiting, returning False when another broker
+    instance holds it. A cache outage counts as taking the lock, so the Ubiq
+    API is called directly.
+    """
+    try:
+        return lock.acquire(blocking=False)
+    except Exception:
+        logging.exception("An exception occurred while locking the Redis cache")
+        return True
+
+
+def release_lock(lock: Any) -> None:
+    """
+    Releases the lock, unless it was never taken or has already expired.
+    """
+    from redis.exceptions import LockError
+
+    try:
+        lock.release()
+    except LockError:
+        pass
+    except Exception:
+        logging.exception("An exception occurred while unlocking the Redis cache")
+
+
+def wait_for_cached_def_keys(
+    names: List[str], access_key: str, signing_key: str, lock: Any
+) -> Dict[str, Any]:
+    """
+    Waits up to DEF_KEYS_LOCK_WAIT seconds for the broker instance holding the
+    lock to cache the given datasets. Returns their cache entries, or None
+    when they were not all cached in time or the fetch released the lock
+    without caching them (e.g., after an error from the Ubiq API).
+    """
+    deadline = time.monotonic() + DEF_KEYS_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(DEF_KEYS_LOCK_POLL)
+
+        contents = servable(get_cached_def_keys(names, access_key, signing_key))
+        if len(contents) == len(names):
+            return contents
+
+        try:
+            if not lock.locked():
+                # The lock may have been released just after caching
+                contents = servable(get_cached_def_keys(names, access_key, signing_key))
+                return contents if len(contents) == len(names) else None
+        except Exception:
+            logging.exception("An exception occurred while reading from the Redis cache")
+            return None
+
+    return None
+
+
+def get_cached_def_keys(
+    names: List[str], access_key: str, signing_key: str
+) -> Dict[str, Any]:
+    """
+    Returns the cache entries of the given datasets, keyed by dataset name,
+    omitting those that are not cached. Each entry holds the dataset's
+    definition and keys as "contents", and the time they were fetched from
+    the Ubiq API as "fetched_at". Entries are read from memory when held there,
+    and otherwise from Redis in a single read.
+    """
+    entries = {}
+    for name in names:
+        entry = local_cache.get((access_key, signing_key, name))
+        if entry is not None:
+            entries[name] = entry
+
+    remaining = [name for name in names if name not in entries]
+    if not remaining or redis_client is None:
+        return entries
+
+    try:
+        cached = redis_client.get_keys(access_key, signing_key, ENDPOINT_NAME, remaining)
+    except Exception:
+        # A cache outage only costs a call to the Ubiq API
+        logging.exception("An exception occurred while reading from the Redis cache")
+        return entries
+
+    for name, entry in cached.items():
+        local_cache.set((access_key, signing_key, name), entry)
+    entries.update(cached)
+    return entries
+
+
+def set_cached_def_keys(
+    names: List[str], access_key: str, signing_key: str, contents: Dict[str, Any]
+) -> None:
+    """
+    Caches the definition and keys of each of the given datasets from a
+    def_keys response in memory, and for DEF_KEYS_CACHE_MAX_AGE seconds in
+    Redis if it is configured.
+    """
+    fetched_at = time.time()
+    entries = {name: {"contents": contents[name], "fetched_at": fetched_at} for name in names}
+    for name, entry in entries.items():
+        local_cache.set((access_key, signing_key, name), entry)
+
+    if redis_client is None:
+        return
+
+    try:
+        redis_client.set_keys(
+            access_key, signing_key, ENDPOINT_NAME, entries, ttl=DEF_KEYS_CACHE_MAX_AGE
+        )
+    except Exception:
+        logging.exception("An exception occurred while writing to the Redis cache")
+
+
+def raise_cached_error(dataset_names: str, access_key: str, signing_key: str) -> None:
+    """
+    Raises the cached error response of the Ubiq API to a def_keys request for
+    the given datasets, if one is cached.
+    """
+    key = (access_key, signing_key, ERROR_ENDPOINT_NAME, dataset_names)
+    error = local_cache.get(key)
+    if error is None and redis_client is not None:
+        try:
+            error = redis_client.get_key(access_key, signing_key, ERROR_ENDPOINT_NAME, dataset_names)
+        except Exception:
+            logging.exception("An exception occurred while reading from the Redis cache")
+        if error is not None:
+            local_cache.set(key, error)
+    if error is None:
+        return
+
+    logging.info(f"Ubiq API error ({error['status_code']}) served from cache")
+    response = requests.Response()
+    response.status_code = error["status_code"]
+    response._content = error["text"].encode("utf-8")
+    response.encoding = "utf-8"
+    raise UbiqResponseError(response)
+
+
+def set_cached_error(
+    dataset_names: str, access_key: str, signing_key: str, response: requests.Response
+) -> None:
+    """
+    Caches an error response of the Ubiq API to a def_keys request for the
+    given datasets, for DEF_KEYS_ERROR_TTL seconds.
+    """
+    error = {"status_code": response.status_code, "text": response.text}
+    local_cache.set((access_key, signing_key, ERROR_ENDPOINT_NAME, dataset_names), error)
+
+    if redis_client is None:
+        return
+
+    try:
+        redis_client.set_key(
+            access_key, signing_key, ERROR_ENDPOINT_NAME, error, dataset_names,
+            ttl=DEF_KEYS_ERROR_TTL,
+        )
+    except Exception:
+        logging.exception("An exception occurred while writing to the Redis cache")
+
+
+def invalidate_cached_def_keys(
+    names: List[str], access_key: str, signing_key: str
+) -> None:
+    """
+    Removes the given datasets from both cache tiers, so they are next fetched
+    from the Ubiq API (e.g., after keys are rotated or revoked).
+    """
+    for name in names:
+        local_cache.invalidate((access_key, signing_key, name))
+
+    if redis_client is None:
+        return
+
+    try:
+        redis_client.delete_keys(access_key, signing_key, ENDPOINT_NAME, names)
+    except Exception:
+        logging.exception("An exception occurred while writing to the Redis cache")
+
+
+def cache_stats() -> Dict[str, int]:
+    """
+    Returns the hits and misses of each cache tier since the broker instance
+    started.
+    """
+    return {
+        "local_hits": local_cache.hits,
+        "local_misses": local_cache.misses,
+        "redis_hits": redis_client.hits if redis_client is not None else 0,
+        "redis_misses": redis_client.misses if redis_client is not None else 0,
+    }
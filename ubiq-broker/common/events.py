@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+from .auth import http_auth
+from .concurrency import map_rows
+from .session import ubiq_session
+
+# Usage events sent to the Ubiq API in a single request
+EVENTS_CHUNK_SIZE = int(os.getenv("UBIQ_EVENTS_CHUNK_SIZE", "1000"))
+
+
+def usage_event(access_key: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converts an event reported by ubiq_close_session to a Ubiq API usage event.
+
+    Args:
+        access_key: the Ubiq API access key the event is billed to
+        event: query history of a Ubiq function call
+
+    Returns:
+        Usage event as expected by the Ubiq API tracking endpoint.
+    """
+    return {
+        "api_key": access_key,
+        "count": event["executionCount"],
+        "product": "ubiq-snowflake",
+        "product_version": "0.1.0",
+        "user_agent": "ubiq-snowflake/0.1.0",
+        "api_version": "v3",
+        "first_call_timestamp": event["start_time"],
+        "last_call_timestamp": event["end_time"],
+        "metadata": {
+            "query_id": event["query_id"],
+            "python_execution_time": event["executionTime"],
+            "warehouse_size": event["warehouse_size"],
+        },
+    }
+
+
+def chunk_usage(rows: List[List[Any]]) -> List[Tuple[str, str, List[Dict[str, Any]]]]:
+    """
+    Merges the events of all request rows by access key and signing key, and
+    splits each credential's events into chunks of at most EVENTS_CHUNK_SIZE.
+
+    Args:
+        rows: request rows of index, events, access key and signing key
+
+    Returns:
+        List of access key, signing key and usage events of each chunk.
+    """
+    usage = {}
+    for idx, events, access_key, signing_key in rows:
+        logging.info(f"Processing row [{idx}] of event data")
+        usage.setdefault((access_key, signing_key), []).extend(
+            usage_event(access_key, event) for event in events
+        )
+
+    return [
+        (access_key, signing_key, events[start:start + EVENTS_CHUNK_SIZE])
+        for (access_key, signing_key), events in usage.items()
+        for start in range(0, len(events), EVENTS_CHUNK_SIZE)
+    ]
+
+
+def post_usage(row: List[Any]) -> None:
+    """
+    Sends a chunk of usage events to the Ubiq API.
+
+    Args:
+        row: the chunk's index, followed by the Ubiq API URL, access key,
+            signing key and usage events
+    """
+    idx, api_url, access_key, signing_key, usage = row
+
+    ubiq_response = ubiq_session.post(
+        url=f"{api_url}/tracking/events",
+        auth=http_auth(access_key, signing_key),
+        headers={"Content-Type": "application/json"},
+        data=json.dumps({"usage": usage}).encode("utf-8"),
+    )
+    if not 200 <= ubiq_response.status_code < 300:
+        # Usage reporting does not fail the session it reports on
+        logging.error(
+            f"Ubiq API rejected [{len(usage)}] events ({ubiq_response.status_code}): {ubiq_response.text}"
+        )
+
+
+def submit_usage(rows: List[List[Any]], api_url: str) -> None:
+    """
+    Sends the events of all request rows to the Ubiq API, merged by
+    credentials into bounded chunks that are sent concurrently over the pooled
+    session.
+
+    Args:
+        rows: request rows of index, events, access key and signing key
+        api_url: base URL of the Ubiq API
+    """
+    chunks = chunk_usage(rows)
+    logging.info(f"Sending event data to ubiq in [{len(chunks)}] requests")
+    map_rows(
+        post_usage,
+        [[idx, api_url, *chunk] for idx, chunk in enumerate(chunks)],
+    )
@@ -1,7 +1,42 @@
+import hashlib
 import json
-from redis import StrictRedis
+import os
 from typing import Dict, List, Any
 
+try:
+    from redis import StrictRedis
+except ImportError:
+    StrictRedis = None
+
+# Redis configuration file; brokers deployed without one, with one still holding
+# the <hostname> placeholder, or without the redis package run without a cache
+REDIS_CONFIG = os.getenv("UBIQ_REDIS_CONFIG", "redis.json")
+
+# Seconds to wait for a connection to Redis, and for each Redis command, before
+# failing the request instead of hanging until the function times out. Used
+# unless redis.json sets socket_connect_timeout / socket_timeout itself.
+REDIS_CONNECT_TIMEOUT = float(os.getenv("UBIQ_REDIS_CONNECT_TIMEOUT", "1"))
+REDIS_TIMEOUT = float(os.getenv("UBIQ_REDIS_TIMEOUT", "1"))
+
+
+def is_configured(redis_config: str = REDIS_CONFIG) -> bool:
+    """
+    Tests whether a Redis cache has been configured for the broker.
+
+    Args:
+        redis_config: name of JSON configuration file containing Redis host,
+            port, database, password and other Redis configuration parameters.
+
+    Returns:
+        Boolean value indicating whether the configuration file exists and
+        names a Redis host, rather than the <hostname> placeholder it ships with.
+    """
+    if not os.path.exists(redis_config):
+        return False
+    with open(redis_config) as config_file:
+        host = json.load(config_file).get("host", "")
+    return bool(host) and not host.startswith("<")
+
 
 class RedisHandler:
     """
@@ -9,7 +44,7 @@ class RedisHandler:
     key in the Redis cache.
     """
 
-    def __init__(self, redis_config="redis.json") -> None:
+    def __init__(self, redis_config=REDIS_CONFIG) -> None:
         """
         Reads the Redis configuration file and configures the Redis client.
 
@@ -18,11 +53,18 @@ class RedisHandler:
                 port, database, password and other Redis configuration parameters.
         """
         # Read Redis configuration file
-        config = json.load(open(redis_config))
+        with open(redis_config) as config_file:
+            config = json.load(config_file)
+        config.setdefault("socket_connect_timeout", REDIS_CONNECT_TIMEOUT)
+        config.setdefault("socket_timeout", REDIS_TIMEOUT)
 
         # Configure Redis client from configuration file parameters
         self.redis = StrictRedis(**config)
 
+        # Keys found and not found by get_keys
+        self.hits = 0
+        self.misses = 0
+
     def key_exists(
         self, access_key: str, signing_key: str, endpoint_name: str, *args: List[str]
     ) -> bool:
@@ -57,13 +99,12 @@ class RedisHandler:
 
         Returns:
             Cached Ubiq API key corresponding to the given access key, signing
-            key and endpoint.
+            key and endpoint, or None if it is not cached.
         """
-        return json.loads(
-            self.redis.get(
-                self._derive_key(access_key, signing_key, endpoint_name, *args)
-            )
+        value = self.redis.get(
+            self._derive_key(access_key, signing_key, endpoint_name, *args)
         )
+        return None if value is None else json.loads(value)
 
     def set_key(
         self,
@@ -72,6 +113,7 @@ class RedisHandler:
         endpoint_name: str,
         ubiq_key: Dict[str, Any],
         *args: List[str],
+        ttl: int = None,
     ) -> None:
         """
         Caches a Ubiq API key corresponding to the given access key, signing key
@@ -82,10 +124,116 @@ class RedisHandler:
             signing_key: the Ubiq API secret signing key
             endpoint_name: the endpoint that was invoked to broker a Ubiq API call
             ubiq_key: the Ubiq API key to cache
+            ttl: seconds until the cached key expires (never, if not given)
         """
         self.redis.set(
             self._derive_key(access_key, signing_key, endpoint_name, *args),
             json.dumps(ubiq_key),
+            ex=ttl,
+        )
+
+    def get_keys(
+        self, access_key: str, signing_key: str, endpoint_name: str, names: List[str]
+    ) -> Dict[str, Any]:
+        """
+        Retrieves the Ubiq API keys cached under each of the given names for the
+        given access key, signing key and endpoint, in a single read.
+
+        Args:
+            access_key: the Ubiq API access key
+            signing_key: the Ubiq API secret signing key
+            endpoint_name: the endpoint that was invoked to broker a Ubiq API call
+            names: names the keys are cached under (e.g., dataset names)
+
+        Returns:
+            Cached Ubiq API keys, keyed by name; names that are not cached are
+            omitted.
+        """
+        values = self.redis.mget(
+            [self._derive_key(access_key, signing_key, endpoint_name, name) for name in names]
+        )
+        ubiq_keys = {
+            name: json.loads(value)
+            for name, value in zip(names, values)
+            if value is not None
+        }
+        self.hits += len(ubiq_keys)
+        self.misses += len(names) - len(ubiq_keys)
+        return ubiq_keys
+
+    def set_keys(
+        self,
+        access_key: str,
+        signing_key: str,
+        endpoint_name: str,
+        ubiq_keys: Dict[str, Any],
+        ttl: int = None,
+    ) -> None:
+        """
+        Caches each of the given Ubiq API keys under its name for the given
+        access key, signing key and endpoint, in a single round trip.
+
+        Args:
+            access_key: the Ubiq API access key
+            signing_key: the Ubiq API secret signing key
+            endpoint_name: the endpoint that was invoked to broker a Ubiq API call
+            ubiq_keys: the Ubiq API keys to cache, keyed by name
+            ttl: seconds until the cached keys expire (never, if not given)
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for name, ubiq_key in ubiq_keys.items():
+            pipeline.set(
+                self._derive_key(access_key, signing_key, endpoint_name, name),
+                json.dumps(ubiq_key),
+                ex=ttl,
+            )
+        pipeline.execute()
+
+    def delete_keys(
+        self, access_key: str, signing_key: str, endpoint_name: str, names: List[str]
+    ) -> None:
+        """
+        Removes the Ubiq API keys cached under each of the given names for the
+        given access key, signing key and endpoint.
+
+        Args:
+            access_key: the Ubiq API access key
+            signing_key: the Ubiq API secret signing key
+            endpoint_name: the endpoint that was invoked to broker a Ubiq API call
+            names: names the keys are cached under (e.g., dataset names)
+        """
+        self.redis.delete(
+            *[self._derive_key(access_key, signing_key, endpoint_name, name) for name in names]
+        )
+
+    def lock(
+        self,
+        access_key: str,
+        signing_key: str,
+        endpoint_name: str,
+        *args: List[str],
+        timeout: float,
+    ) -> Any:
+        """
+        Creates a lock guarding the Ubiq API key corresponding to the given
+        access key, signing key and endpoint, shared by every broker instance
+        using the cache.
+
+        Args:
+            access_key: the Ubiq API access key
+            signing_key: the Ubiq API secret signing key
+            endpoint_name: the endpoint that was invoked to broker a Ubiq API call
+            timeout: seconds until a held lock expires, so a broker instance
+                that fails while holding it never blocks the others
+
+        Returns:
+            Redis lock for the given access key, signing key and endpoint.
+        """
+        return self.redis.lock(
+            self._derive_key(access_key, signing_key, endpoint_name, *args, "lock"),
+            timeout=timeout,
+            # The lock may be released by another thread than the one taking it
+            thread_local=False,
         )
 
     @staticmethod
@@ -95,7 +243,8 @@ class RedisHandler:
         """
         Derives unique Redis key from a given access key, signing key, endpoint
         name and any additional optional parameters (e.g., Field Format Specification)
-        by concatenating each parameter with hyphen separators.
+        by concatenating each parameter with hyphen separators. The signing key
+        is included as its SHA-256 hash so the secret never appears in key names.
 
         Args:
             access_key: the Ubiq API access key
@@ -106,8 +255,9 @@ class RedisHandler:
             Derived Redis key for the given access key, signing key, Ubiq
             endpoint and optional delineating parameters.
         """
-        return "-".join([access_key, signing_key, endpoint_name, *args])
+        signing_key_hash = hashlib.sha256(signing_key.encode("utf-8")).hexdigest()
+        return "-".join([access_key, signing_key_hash, endpoint_name, *args])
 
 
 # Set singleton instance
-redis_client = RedisHandler()
+redis_client = RedisHandler() if StrictRedis is not None and is_configured() else None
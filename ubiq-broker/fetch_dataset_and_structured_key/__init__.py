@@ -1,28 +1,110 @@
+import asyncio
 import logging
 import azure.functions as func
 import requests
 import json
-from common.redis_handler import redis_client
+from common.concurrency import map_rows
+from common.def_keys import (
+    cache_stats,
+    fetch_def_keys,
+    run_pending_refreshes,
+    UbiqResponseError,
+)
 from common import (
-    http_auth,
     format_response,
     format_error_response,
     unpack_request,
     validate_access_key,
     validate_signing_key,
-    parse_ubiq_response,
-    UBIQ_API_URL
+    trim_known_keys,
 )
 
 def handle_error(response):
     if isinstance(response, requests.Response):
         return func.HttpResponse(format_error_response(f"An exception occurred while calling Ubiq Structured Encryption Key API endpoint ({response.status_code}): {response.text} "), status_code=response.status_code)
     elif isinstance(response, Exception):
-        return func.HttpResponse(format_error_response(str(e), status_code=500))
+        return func.HttpResponse(format_error_response(str(response)), status_code=500)
     else:
         return func.HttpResponse(format_error_response(f"An exception occurred while calling Ubiq Structured Encryption Key API endpoint."), status_code=500)
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+def validate_row(row):
+    """
+    Validates the dataset names, access key and signing key of a request row.
+
+    Args:
+        row: request row of index, dataset names, access key, signing key and
+            optionally the number of keys already held per dataset
+    """
+    idx, dataset_names, access_key, signing_key, *known_keys = row
+
+    # Validate dataset name
+    if not isinstance(dataset_names, str):
+        raise AttributeError("Field Format Specification in request is malformed")
+
+    # Validate access key and signing key format
+    validate_access_key(access_key)
+    validate_signing_key(signing_key)
+
+def fetch_request(row):
+    """
+    Retrieves the datasets and keys of a distinct request.
+
+    Args:
+        row: the request, followed by its dataset names, access key and
+            signing key
+    """
+    _, dataset_names, access_key, signing_key = row
+
+    logging.info(f"Fetching datasets [{dataset_names}] of fetch key request")
+
+    # Get the datasets and keys from the cache or the Ubiq API
+    return fetch_def_keys(dataset_names, access_key, signing_key)
+
+def fetch_rows(rows):
+    """
+    Retrieves the datasets and keys of every request row, fetching each
+    distinct combination of dataset names, access key and signing key once.
+
+    Args:
+        rows: request rows, as returned by unpack_request
+
+    Returns:
+        List of each row's index and response contents, in request order.
+    """
+    for row in rows:
+        validate_row(row)
+
+    # Identical requests in a batch, as sent when the broker function is
+    # evaluated over a result set, are only fetched once
+    distinct = list(dict.fromkeys(tuple(row[1:4]) for row in rows))
+    logging.info(f"Fetching [{len(distinct)}] distinct requests for [{len(rows)}] rows")
+    fetched = dict(map_rows(fetch_request, [[request, *request] for request in distinct]))
+
+    response_contents = []
+    for idx, dataset_names, access_key, signing_key, *known_keys in rows:
+        contents = fetched[(dataset_names, access_key, signing_key)]
+
+        # Only return key generations the caller does not already hold
+        if known_keys and known_keys[0]:
+            contents = trim_known_keys(contents, known_keys[0])
+
+        response_contents.append((idx, contents))
+
+    return response_contents
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    loop = asyncio.get_running_loop()
+
+    # The request blocks on the cache and the Ubiq API, so it is handled on a
+    # worker thread rather than on the event loop
+    response = await loop.run_in_executor(None, handle_request, req)
+
+    # Stale datasets were served as cached; they are refreshed on a worker
+    # thread that the function host keeps running after the response is sent
+    loop.run_in_executor(None, run_pending_refreshes)
+    return response
+
+def handle_request(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Received request to fetch dataset and structured encryption key")
 
     try:
@@ -33,58 +115,29 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(format_error_response(msg), status_code=400)
 
     try:
-        # Extract and validate each row within the request
-        rows = unpack_request(req_body, 4)
+        # Extract and validate each row within the request; ubiq_refresh_session
+        # additionally sends the number of keys it already holds per dataset
+        rows = unpack_request(req_body, 4, 1)
     except AttributeError as e:
         logging.exception(e)
         return func.HttpResponse(format_error_response(str(e)), status_code=400)
 
-    # List of response contents
-    response_contents = []
-    dataset_name_list = []
-
-    # Extract dataset name, access key ID and secret signing key and query Ubiq API
-    for idx, dataset_names, access_key, signing_key in rows:
-
-        logging.info(f"Processing row [{idx}] of fetch key request")
-
-        # Validate dataset name
-        if not isinstance(dataset_names, str):
-            msg = "Field Format Specification in request is malformed"
-            logging.error(msg)
-            return func.HttpResponse(format_error_response(msg), status_code=400)
-
-        # Validate access key and signing key format
-        try:
-            validate_access_key(access_key)
-            validate_signing_key(signing_key)
-        except AttributeError as e:
-            logging.exception(e)
-            return func.HttpResponse(format_error_response(str(e)), status_code=400)
-
-        try:
-            # Call Ubiq API to get the key
-            ubiq_response = requests.get(
-                url=f"{UBIQ_API_URL}/fpe/def_keys?ffs_name={dataset_names}&papi={access_key}",
-                auth=http_auth(access_key, signing_key),
-            )
-        except Exception as e:
-            return handle_error(e)
-
-        try:
-            # Parse contents of Ubiq API response
-            if ubiq_response.status_code != 200:
-                return handle_error(ubiq_response)
-            contents = parse_ubiq_response(ubiq_response, dataset_names.split(','))
-        except Exception as e:
-            return handle_error(e)
-
-        response_contents.append(contents)
-    logging.info("Request to fetch encryption key successful")
+    try:
+        # Requests are fetched concurrently, each row answered at its own index
+        response_contents = fetch_rows(rows)
+    except AttributeError as e:
+        logging.exception(e)
+        return func.HttpResponse(format_error_response(str(e)), status_code=400)
+    except UbiqResponseError as e:
+        return handle_error(e.response)
+    except Exception as e:
+        logging.exception(e)
+        return handle_error(e)
+    logging.info(f"Request to fetch encryption key successful, cache statistics {cache_stats()}")
 
     # Transmit HTTP response with Ubiq-supplied parameters
     # NOTE: Snowflake only recognizes status code 200 as a success indicator
     return func.HttpResponse(
-        json.dumps({"data": [[0,response_contents[0]]]}),
+        json.dumps({"data": [[idx, contents] for idx, contents in response_contents]}),
         status_code=200,
     )
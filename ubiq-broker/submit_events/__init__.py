@@ -1,10 +1,8 @@
 import logging
 import azure.functions as func
-import requests
 import json
-from common.redis_handler import redis_client
+from common.events import submit_usage
 from common import (
-    http_auth,
     format_response,
     format_error_response,
     unpack_request,
@@ -33,63 +31,28 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         logging.exception(e)
         return func.HttpResponse(format_error_response(str(e)), status_code=400)
 
-    # List of response contents
-    response_contents = []
-
-    # Extract Events, access key ID and secret signing key and query Ubiq API
-    for idx, events, access_key, signing_key in rows:
-        usage = []
-        for event in events:
-            logging.info(f"Processing row [{idx}] of event data")
-            usage.append(
-                {
-                    "api_key": access_key,
-                    "count": event['executionCount'],
-                    "product": "ubiq-snowflake",
-                    "product_version": "0.1.0",
-                    "user_agent": "ubiq-snowflake/0.1.0",
-                    "api_version": "v3",
-                    "first_call_timestamp": event['start_time'],
-                    "last_call_timestamp": event['end_time'],
-                    "metadata": {
-                        "query_id": event['query_id'],
-                        "python_execution_time": event['executionTime'],
-                        "warehouse_size": event['warehouse_size']
-                    }
-                }
-            )
-
-        # Validate access key and signing key format
-        try:
+    # Validate access key and signing key format
+    try:
+        for idx, events, access_key, signing_key in rows:
             validate_access_key(access_key)
             validate_signing_key(signing_key)
-        except AttributeError as e:
-            logging.exception(e)
-            return func.HttpResponse(format_error_response(str(e)), status_code=400)
+    except AttributeError as e:
+        logging.exception(e)
+        return func.HttpResponse(format_error_response(str(e)), status_code=400)
 
-        data = json.dumps({
-                    "usage": usage
-                }).encode('utf-8')
-        try:
-            logging.info(f"Sending event data to ubiq")
-            # Call Ubiq API to get the key
-            ubiq_response = requests.post(
-                url=f"{UBIQ_API_URL}/tracking/events",
-                auth=http_auth(access_key, signing_key),
-                headers={'Content-Type': 'application/json'},
-                data=data
-            )
-        except Exception as e:
-            msg = f"An exception occurred while calling Ubiq API endpoint. {str(e)} -- Data Sent {data}"
-            logging.exception(msg)
-            return func.HttpResponse(format_error_response(msg), status_code=500)
-            
+    try:
+        # Events of all rows are merged and sent in bounded chunks
+        submit_usage(rows, UBIQ_API_URL)
+    except Exception as e:
+        msg = f"An exception occurred while calling Ubiq API endpoint. {str(e)}"
+        logging.exception(msg)
+        return func.HttpResponse(format_error_response(msg), status_code=500)
 
     logging.info("Events reported successfully")
 
     # Transmit HTTP response with Ubiq-supplied parameters
     # NOTE: Snowflake only recognizes status code 200 as a success indicator
     return func.HttpResponse(
-        json.dumps({"data": [[0,"Success"]]}),
+        json.dumps({"data": [[idx, "Success"] for idx, *_ in rows]}),
         status_code=200,
     )
@@ -2,7 +2,7 @@ import fire
 import pandas as pd
 from typing import Iterable, Tuple
 from snowflake.snowpark import Session
-from snowflake.snowpark.types import PandasDataFrame, PandasSeries
+from snowflake.snowpark.types import PandasDataFrame, PandasSeries, Variant
 from snowflake.snowpark.functions import pandas_udf
 from typing import Dict
 import ubiq
@@ -11,6 +11,44 @@ import ubiq.structured as ubiq_structured
 WRAP_EXCEPTIONS = True
 HANDLE_EXCEPTIONS = True
 
+# Registration settings applied to every deployed function.
+#   immutable: declare UDFs IMMUTABLE (same inputs always give the same output)
+#   max_batch_size: upper bound on rows per vectorized UDF batch (None lets
+#       Snowflake size the batches)
+# The session cache lookup helpers are never MEMOIZABLE, whatever the profile:
+# they read the session's temporary ubiq_cache table, which a memoized result
+# would outlive.
+DEPLOYMENT_PROFILES = {
+    "default": {"immutable": False, "max_batch_size": None},
+    "throughput": {"immutable": True, "max_batch_size": None},
+    "latency": {"immutable": True, "max_batch_size": 1000},
+}
+
+# Session cache lookups used by the SQL wrappers in ubiq_functions.sql, as
+# name: (arguments, query). Every query aggregates: a wrapper called with a
+# column makes the lookup a correlated subquery, which Snowflake only accepts
+# when it is an aggregate.
+CACHE_HELPERS = {
+    "_ubiq_encrypt_cache": (
+        '"dataset_name" varchar',
+        'select any_value(c.encrypt_cache) from ubiq_cache c where c.dataset_name = "dataset_name"',
+    ),
+    "_ubiq_decrypt_cache": (
+        '"dataset_name" varchar',
+        'select any_value(c.decrypt_cache) from ubiq_cache c where c.dataset_name = "dataset_name"',
+    ),
+    "_ubiq_encrypt_caches": (
+        '"dataset_names" array',
+        "select object_agg(c.dataset_name, get(c.encrypt_cache, c.dataset_name)) "
+        'from ubiq_cache c where array_contains(c.dataset_name::variant, "dataset_names")',
+    ),
+    "_ubiq_decrypt_caches": (
+        '"dataset_names" array',
+        "select object_agg(c.dataset_name, get(c.decrypt_cache, c.dataset_name)) "
+        'from ubiq_cache c where array_contains(c.dataset_name::variant, "dataset_names")',
+    ),
+}
+
 def handle_exceptions(e, input):
     if HANDLE_EXCEPTIONS:
         return input
@@ -29,6 +67,7 @@ def deploy_functions(
     schema: str,
     role="ACCOUNTADMIN",
     stage="ubiq_package_stage",
+    profile="default",
 ) -> None:
     """
     Creates a new Snowflake session, uploads Ubiq pacakge to the Snowflake
@@ -43,7 +82,15 @@ def deploy_functions(
         schema: name of the schema in which to create Ubiq UDFs
         stage: name of the Snowflake stage in which to serialize Ubiq library
             (defaults to ubiq_package_stage)
+        profile: name of the deployment profile in DEPLOYMENT_PROFILES
+            (default, throughput or latency)
     """
+    if profile not in DEPLOYMENT_PROFILES:
+        raise ValueError(
+            f"Unknown deployment profile \"{profile}\". "
+            f"Expected one of: {', '.join(DEPLOYMENT_PROFILES)}"
+        )
+    settings = DEPLOYMENT_PROFILES[profile]
 
     # Create the Snowflake session
     session = Session.builder.configs(
@@ -73,6 +120,19 @@ def deploy_functions(
         is_permanent=True,
         stage_location=stage,
         replace=True,
+        immutable=settings["immutable"],
+    )
+
+    # Register session refresh function on Snowflake
+    session.udf.register(
+        ubiq_refresh_data_key,
+        name="_ubiq_refresh_data_key",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
     )
 
     # Register encryption and decryption user-defined functions
@@ -85,6 +145,7 @@ def deploy_functions(
         is_permanent=True,
         stage_location=stage,
         replace=True,
+        immutable=settings["immutable"],
     )
     session.udf.register(
         ubiq_encrypt_for_search,
@@ -94,6 +155,7 @@ def deploy_functions(
         is_permanent=True,
         stage_location=stage,
         replace=True,
+        immutable=settings["immutable"],
     )
     session.udtf.register(
         EncryptForSearch,
@@ -102,7 +164,8 @@ def deploy_functions(
         is_permanent=True,
         replace=True,
         stage_location=stage,
-        packages=["cryptography"]
+        packages=["cryptography"],
+        immutable=settings["immutable"],
     )
     session.udf.register(
         ubiq_decrypt,
@@ -112,6 +175,7 @@ def deploy_functions(
         is_permanent=True,
         stage_location=stage,
         replace=True,
+        immutable=settings["immutable"],
     )
 
     # Used pandas_udf function to deploy as vectorized function
@@ -123,6 +187,8 @@ def deploy_functions(
         is_permanent=True,
         stage_location=stage,
         replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
     )
     # Used pandas_udf function to deploy as vectorized function
     pandas_udf(
@@ -133,7 +199,179 @@ def deploy_functions(
         is_permanent=True,
         stage_location=stage,
         replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+    # Output types are taken from the end_partition type hints since process
+    # only buffers rows
+    session.udtf.register(
+        EncryptForSearchPartition,
+        ["input_id", "key_number", "cipher_text"],
+        name="_ubiq_encrypt_for_search_partition",
+        is_permanent=True,
+        replace=True,
+        stage_location=stage,
+        packages=["cryptography"],
+        immutable=settings["immutable"],
+    )
+
+    # Re-keys cipher text protected with an older key in a single pass
+    pandas_udf(
+        ubiq_rekey_batch,
+        name="_ubiq_rekey_batch",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+
+    # Integer functions keep NUMBER columns numeric for digit-only datasets
+    pandas_udf(
+        ubiq_encrypt_number_batch,
+        name="_ubiq_encrypt_number_batch",
+        session=session,
+        packages=["cryptography", "numpy"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+    pandas_udf(
+        ubiq_decrypt_number_batch,
+        name="_ubiq_decrypt_number_batch",
+        session=session,
+        packages=["cryptography", "numpy"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+
+    # Multi-column functions protect every sensitive column of a row in one call
+    pandas_udf(
+        ubiq_encrypt_columns_batch,
+        name="_ubiq_encrypt_columns_batch",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+    pandas_udf(
+        ubiq_decrypt_columns_batch,
+        name="_ubiq_decrypt_columns_batch",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+    pandas_udf(
+        ubiq_encrypt_object_batch,
+        name="_ubiq_encrypt_object_batch",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+    pandas_udf(
+        ubiq_decrypt_object_batch,
+        name="_ubiq_decrypt_object_batch",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+
+    # Document functions protect selected paths inside VARIANT values
+    session.udf.register(
+        ubiq_encrypt_document,
+        name="_ubiq_encrypt_document",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+    )
+    session.udf.register(
+        ubiq_decrypt_document,
+        name="_ubiq_decrypt_document",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+    )
+    pandas_udf(
+        ubiq_encrypt_document_batch,
+        name="_ubiq_encrypt_document_batch",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
     )
+    pandas_udf(
+        ubiq_decrypt_document_batch,
+        name="_ubiq_decrypt_document_batch",
+        session=session,
+        packages=["cryptography"],
+        is_permanent=True,
+        stage_location=stage,
+        replace=True,
+        immutable=settings["immutable"],
+        max_batch_size=settings["max_batch_size"],
+    )
+
+    # Create the session cache lookups used by the SQL wrappers. The temporary
+    # ubiq_cache table only exists so the function bodies can be validated;
+    # ubiq_begin_session creates the real one in each user session.
+    session.sql(
+        "create or replace temporary table ubiq_cache "
+        "(dataset_name varchar, encrypt_cache object, decrypt_cache object)"
+    ).collect()
+    for helper, (arguments, query) in CACHE_HELPERS.items():
+        session.sql(cache_helper_sql(helper, arguments, query)).collect()
+    session.sql("drop table ubiq_cache").collect()
+
+
+def cache_helper_sql(name: str, arguments: str, query: str) -> str:
+    """
+    Builds the SQL for a session cache lookup helper.
+
+    Args:
+        name: name of the SQL function to create
+        arguments: the function's argument declarations
+        query: query over ubiq_cache returning the cache slice(s)
+
+    Returns:
+        The create function statement.
+    """
+    return f"""create or replace function {name}({arguments})
+returns object
+as
+$$
+{query}
+$$"""
 
 
 def ubiq_fetch_data_key(
@@ -142,21 +380,68 @@ def ubiq_fetch_data_key(
     """ """
     dataset_names = dataset_name.split(',')
     for name in dataset_names:
+        # Every key of a dataset is wrapped with the same private key; decrypt it once
+        prvkey = ubiq_structured.common.loadPrivateKey(
+            ubiq_cache[name]["encrypted_private_key"], secret_crypto_access_key
+        )
         ubiq_cache[name]["keys"] = [
-            ubiq_structured.common.fetchKey(
-                {
-                    "encrypted_private_key": ubiq_cache[name][
-                        "encrypted_private_key"
-                    ],
-                    "wrapped_data_key": encrypted_key,
-                },
-                secret_crypto_access_key,
-            )
+            ubiq_structured.common.unwrapKey(prvkey, encrypted_key)
             for encrypted_key in ubiq_cache[name]["keys"]
         ]
 
     return ubiq_cache
 
+
+def ubiq_refresh_data_key(
+    dataset_name: str,
+    secret_crypto_access_key: str,
+    ubiq_cache: Dict,
+    session_cache: Dict,
+) -> Dict:
+    """
+    Merges a fresh broker response into an existing session cache, unwrapping
+    only the keys that the session does not already hold.
+
+    Args:
+        dataset_name: comma separated dataset names to refresh
+        secret_crypto_access_key: The client's secret RSA encryption key/password
+            (used to decrypt the client's RSA key from the server)
+        ubiq_cache: Ubiq dataset parameters and wrapped structured keys from the
+            broker; keys the session already holds may be sent as null
+        session_cache: the current session cache, with unwrapped keys, keyed
+            by dataset name
+
+    Returns:
+        The session cache with the refreshed datasets merged in.
+    """
+    session_cache = dict(session_cache or {})
+    for name in dataset_name.split(','):
+        cached = session_cache.get(name)
+        cached_keys = cached["keys"] if cached else []
+        wrapped_keys = ubiq_cache[name]["keys"]
+
+        if (cached
+                and cached["current_key_number"] == ubiq_cache[name]["current_key_number"]
+                and len(cached_keys) == len(wrapped_keys)):
+            continue
+
+        # Key numbers are stable, so only generations past the cached ones need unwrapping
+        prvkey = None
+        keys = []
+        for key_number, encrypted_key in enumerate(wrapped_keys):
+            if key_number < len(cached_keys):
+                keys.append(cached_keys[key_number])
+                continue
+            if prvkey is None:
+                prvkey = ubiq_structured.common.loadPrivateKey(
+                    ubiq_cache[name]["encrypted_private_key"], secret_crypto_access_key
+                )
+            keys.append(ubiq_structured.common.unwrapKey(prvkey, encrypted_key))
+
+        session_cache[name] = {**ubiq_cache[name], "keys": keys}
+
+    return session_cache
+
 '''
 Currently Deprecated
 Users should use cache rather than passing/pulling at run time
@@ -280,6 +565,33 @@ class EncryptForSearch:
             yield (encrypted, )
 
 
+class EncryptForSearchPartition:
+    """
+    Buffers the rows of a partition and encrypts them for search in
+    end_partition, so each dataset (one context per key) is prepared once per
+    partition instead of once per row.
+    """
+    def __init__(self):
+        self._rows = {}
+        self._caches = {}
+
+    def process(self,
+                input_id: str,
+                dataset_name: str,
+                plain_text: str,
+                ubiq_cache: Dict) -> None:
+        self._rows.setdefault(dataset_name, []).append((input_id, plain_text))
+        self._caches.setdefault(dataset_name, ubiq_cache)
+
+    def end_partition(self) -> Iterable[Tuple[str, int, str]]:
+        for dataset_name, rows in self._rows.items():
+            yield from ubiq_structured.EncryptForSearchCacheRows(
+                dataset_name, self._caches[dataset_name], rows
+            )
+        self._rows = {}
+        self._caches = {}
+
+
 def ubiq_decrypt(
     dataset_name: str,
     cipher_text: str,
@@ -309,57 +621,373 @@ def ubiq_decrypt(
 
 
 def ubiq_encrypt_batch(
-    df: PandasDataFrame[str, str, str, Dict],
+    df: PandasDataFrame[str, str, Dict],
 ) -> PandasSeries[str]:
     """
-    Encrypts the given plain text data using a Ubiq-provided key and dataset 
-    cache dictionary of multiple datasets and possible keys.
+    Encrypts the given batch of plain text data using a Ubiq-provided key and
+    the session cache slice for the dataset.
 
     Args:
         df:
-            0: plain-text string data to be encrypted
-            1: the client's secret RSA encryption key/password (used to decrypt
-                the client's RSA key from the server)
-            2: Ubiq dataset structured cache in one Dictionary
+            0: Ubiq dataset name
+            1: plain-text string data to be encrypted
+            2: Ubiq dataset structured cache slice, keyed by dataset name
     Returns:
-        Encrypted cipher text for the given plain-text string.
+        Encrypted cipher text for the given plain-text strings.
     """
     
+    try:
+        return map_dataset_batch(ubiq_structured.EncryptCacheBatch, df)
+    except Exception as e:
+        return handle_exceptions(e, df[1])
+
+def ubiq_decrypt_batch(
+    df: PandasDataFrame[str, str, Dict],
+) -> PandasSeries[str]:
+    """
+    Decrypts the given batch of cipher text data using a Ubiq-provided key and
+    the session cache slice for the dataset.
+
+    Args:
+        df:
+            0: Ubiq dataset name
+            1: cipher-text string data to be decrypted
+            2: Ubiq dataset structured cache slice, keyed by dataset name
+
+    Returns:
+        Decrypted plain-text for the given cipher text strings.
+    """
+    try:
+        return map_dataset_batch(ubiq_structured.DecryptCacheBatch, df)
+    except Exception as e:
+        return handle_exceptions(e, df[1])
+
+
+def ubiq_rekey_batch(
+    df: PandasDataFrame[str, str, Dict],
+) -> PandasSeries[str]:
+    """
+    Re-encrypts the given batch of cipher text data with the dataset's current
+    key, leaving cipher text that already uses the current key unchanged.
+
+    Args:
+        df:
+            0: Ubiq dataset name
+            1: cipher-text string data to be re-keyed
+            2: Ubiq dataset structured cache slice (with all keys), keyed by
+                dataset name
+
+    Returns:
+        Cipher text protected with the current key for the given cipher text
+        strings.
+    """
+    try:
+        return map_dataset_batch(ubiq_structured.ReKeyCacheBatch, df)
+    except Exception as e:
+        return handle_exceptions(e, df[1])
+
+def ubiq_encrypt_columns_batch(
+    df: PandasDataFrame[list, list, Dict],
+) -> PandasSeries[list]:
+    """
+    Encrypts several columns of each row in one call, preparing each dataset
+    once for the whole batch.
+
+    Args:
+        df:
+            0: Ubiq dataset names, one per column
+            1: plain-text string data to be encrypted, one per column
+            2: Ubiq dataset structured cache slices, keyed by dataset name,
+                covering the datasets the row names
+    Returns:
+        Arrays of encrypted cipher text, parallel to the given columns.
+    """
     try:
         result = pd.Series(
-            ubiq_structured.EncryptCacheBatch(
-                df[1].iloc[0], df[2].iloc[0], df[3].iloc[0], df[0])
+            ubiq_structured.EncryptCacheColumns(
+                df[0], merge_caches(df[2]), df[1])
         )
         return result
     except Exception as e:
-        return handle_exceptions(e, df[3].iloc[0])
+        return handle_exceptions(e, df[1])
 
-def ubiq_decrypt_batch(
-    df: PandasDataFrame[str, str, str, Dict],
-) -> PandasSeries[str]:
+def ubiq_decrypt_columns_batch(
+    df: PandasDataFrame[list, list, Dict],
+) -> PandasSeries[list]:
     """
-    Decrypts the given cipher text data using a Ubiq-provided key and dataset 
-    cache dictionary of multiple datasets and possible keys.
+    Decrypts several columns of each row in one call, preparing each dataset
+    once for the whole batch.
+
+    Args:
+        df:
+            0: Ubiq dataset names, one per column
+            1: cipher-text string data to be decrypted, one per column
+            2: Ubiq dataset structured cache slices, keyed by dataset name,
+                covering the datasets the row names
+    Returns:
+        Arrays of decrypted plain text, parallel to the given columns.
+    """
+    try:
+        result = pd.Series(
+            ubiq_structured.DecryptCacheColumns(
+                df[0], merge_caches(df[2]), df[1])
+        )
+        return result
+    except Exception as e:
+        return handle_exceptions(e, df[1])
+
+def ubiq_encrypt_object_batch(
+    df: PandasDataFrame[Dict, Dict, Dict],
+) -> PandasSeries[Dict]:
+    """
+    Encrypts the mapped columns of each row in one call, preparing each
+    dataset once for the whole batch.
 
     Args:
         df:
-            0: cipher-text string data to be decrypted
-            1: the client's secret RSA encryption key/password (used to decrypt
-                the client's RSA key from the server)
-            2: Ubiq dataset structured cache in one Dictionary
+            0: Ubiq dataset name for each column to encrypt, keyed by column
+            1: the row's values, keyed by column
+            2: Ubiq dataset structured cache slices, keyed by dataset name,
+                covering the datasets the row maps
+    Returns:
+        The row objects with the mapped columns encrypted.
+    """
+    try:
+        result = pd.Series(
+            map_object_columns(
+                ubiq_structured.EncryptCacheColumns, df[0], merge_caches(df[2]), df[1])
+        )
+        return result
+    except Exception as e:
+        return handle_exceptions(e, df[1])
+
+def ubiq_decrypt_object_batch(
+    df: PandasDataFrame[Dict, Dict, Dict],
+) -> PandasSeries[Dict]:
+    """
+    Decrypts the mapped columns of each row in one call, preparing each
+    dataset once for the whole batch.
 
+    Args:
+        df:
+            0: Ubiq dataset name for each column to decrypt, keyed by column
+            1: the row's values, keyed by column
+            2: Ubiq dataset structured cache slices, keyed by dataset name,
+                covering the datasets the row maps
     Returns:
-        Decrypted plain-text for the given cipher text string.
+        The row objects with the mapped columns decrypted.
     """
     try:
-        result =  pd.Series(
-            ubiq_structured.DecryptCacheBatch(
-                df[1].iloc[0], df[2].iloc[0], df[3].iloc[0], df[0])
+        result = pd.Series(
+            map_object_columns(
+                ubiq_structured.DecryptCacheColumns, df[0], merge_caches(df[2]), df[1])
         )
         return result
     except Exception as e:
-        return handle_exceptions(e, df[3].iloc[0])
+        return handle_exceptions(e, df[1])
+
+def ubiq_encrypt_number_batch(
+    df: PandasDataFrame[str, int, Dict],
+) -> PandasSeries[int]:
+    """
+    Encrypts the given batch of integers for a digit-only dataset, returning
+    integers that are zero padded to the dataset's max_input_length.
 
+    Args:
+        df:
+            0: Ubiq dataset name
+            1: integer data to be encrypted
+            2: Ubiq dataset structured cache slice, keyed by dataset name
+    Returns:
+        Encrypted integers for the given integers.
+    """
+    try:
+        return map_number_batch(ubiq_structured.EncryptNumberCacheBatch, df)
+    except Exception as e:
+        return handle_exceptions(e, df[1])
+
+def ubiq_decrypt_number_batch(
+    df: PandasDataFrame[str, int, Dict],
+) -> PandasSeries[int]:
+    """
+    Decrypts the given batch of integers for a digit-only dataset.
+
+    Args:
+        df:
+            0: Ubiq dataset name
+            1: encrypted integer data to be decrypted
+            2: Ubiq dataset structured cache slice, keyed by dataset name
+    Returns:
+        Decrypted integers for the given encrypted integers.
+    """
+    try:
+        return map_number_batch(ubiq_structured.DecryptNumberCacheBatch, df)
+    except Exception as e:
+        return handle_exceptions(e, df[1])
+
+def map_dataset_batch(cipher_batch, df) -> pd.Series:
+    """
+    Applies a single-dataset batch cipher function to the rows of each dataset
+    in the batch, with that dataset's cache slice, as a batch may mix rows of
+    several datasets.
+    """
+    groups = df.groupby(0, sort=False).indices
+    if len(groups) == 1:
+        return pd.Series(
+            list(cipher_batch(df[0].iloc[0], df[2].iloc[0], df[1])), index=df.index)
+
+    results = [None] * len(df)
+    for dataset_name, positions in groups.items():
+        values = cipher_batch(dataset_name, df[2].iloc[positions[0]], df[1].iloc[positions])
+        for position, value in zip(positions, values):
+            results[position] = value
+    return pd.Series(results, index=df.index)
+
+def map_number_batch(cipher_batch, df) -> pd.Series:
+    """
+    Applies an integer batch cipher function to the non-null values of each
+    dataset in the batch as a single array, leaving nulls in place.
+    """
+    values = df[1]
+    present = values.notna()
+    results = map_dataset_batch(
+        lambda dataset_name, ubiq_cache, numbers: cipher_batch(
+            dataset_name, ubiq_cache, numbers.to_numpy()),
+        df[present])
+    if present.all():
+        return results
+
+    result = pd.Series(None, index=values.index, dtype=object)
+    result[present] = results.to_numpy(dtype=object)
+    return result
+
+def merge_caches(caches) -> Dict:
+    """
+    Merges the cache slices of every row of a batch, as each row only carries
+    the slices of the datasets it names.
+    """
+    merged = {}
+    for ubiq_cache in caches:
+        merged.update(ubiq_cache)
+    return merged
+
+def map_object_columns(cipher_columns, dataset_maps, ubiq_cache, rows) -> list:
+    """
+    Applies a column-wise cipher function to the mapped keys of row objects,
+    leaving the other keys unchanged.
+    """
+    columns = [[c for c in dataset_map if c in row] for dataset_map, row in zip(dataset_maps, rows)]
+    results = cipher_columns(
+        [[dataset_map[c] for c in cols] for dataset_map, cols in zip(dataset_maps, columns)],
+        ubiq_cache,
+        [[row[c] for c in cols] for row, cols in zip(rows, columns)],
+    )
+    return [
+        {**row, **dict(zip(cols, values))}
+        for row, cols, values in zip(rows, columns, results)
+    ]
+
+
+def ubiq_encrypt_document(
+    document: Variant,
+    paths: Dict,
+    ubiq_cache: Dict,
+) -> Variant:
+    """
+    Encrypts the values at the given paths of a VARIANT document.
+
+    Args:
+        document: the document to encrypt
+        paths: Ubiq dataset name to encrypt each path with, keyed by path
+            (eg `customer.ssn` or `phones[*].number`)
+        ubiq_cache: Ubiq dataset structured cache slices, keyed by dataset name
+
+    Returns:
+        The document with the values at the given paths encrypted.
+    """
+    try:
+        result = ubiq_structured.EncryptDocumentCache(
+            paths, ubiq_cache, document
+        )
+        return result
+    except Exception as e:
+        return handle_exceptions(e, document)
+
+def ubiq_decrypt_document(
+    document: Variant,
+    paths: Dict,
+    ubiq_cache: Dict,
+) -> Variant:
+    """
+    Decrypts the values at the given paths of a VARIANT document.
+
+    Args:
+        document: the document to decrypt
+        paths: Ubiq dataset name to decrypt each path with, keyed by path
+            (eg `customer.ssn` or `phones[*].number`)
+        ubiq_cache: Ubiq dataset structured cache slices, keyed by dataset name
+
+    Returns:
+        The document with the values at the given paths decrypted.
+    """
+    try:
+        result = ubiq_structured.DecryptDocumentCache(
+            paths, ubiq_cache, document
+        )
+        return result
+    except Exception as e:
+        return handle_exceptions(e, document)
+
+def ubiq_encrypt_document_batch(
+    df: PandasDataFrame[Variant, Dict, Dict],
+) -> PandasSeries[Variant]:
+    """
+    Encrypts the values at the given paths of a batch of VARIANT documents,
+    preparing each dataset once for the whole batch.
+
+    Args:
+        df:
+            0: the documents to encrypt
+            1: Ubiq dataset name to encrypt each path with, keyed by path
+            2: Ubiq dataset structured cache slices, keyed by dataset name,
+                covering the datasets the row's paths map to
+    Returns:
+        The documents with the values at the given paths encrypted.
+    """
+    try:
+        result = pd.Series(
+            ubiq_structured.EncryptDocumentCacheBatch(
+                df[1], merge_caches(df[2]), df[0])
+        )
+        return result
+    except Exception as e:
+        return handle_exceptions(e, df[0])
+
+def ubiq_decrypt_document_batch(
+    df: PandasDataFrame[Variant, Dict, Dict],
+) -> PandasSeries[Variant]:
+    """
+    Decrypts the values at the given paths of a batch of VARIANT documents,
+    preparing each dataset once for the whole batch.
+
+    Args:
+        df:
+            0: the documents to decrypt
+            1: Ubiq dataset name to decrypt each path with, keyed by path
+            2: Ubiq dataset structured cache slices, keyed by dataset name,
+                covering the datasets the row's paths map to
+    Returns:
+        The documents with the values at the given paths decrypted. Numbers
+        encrypted by ubiq_encrypt_document_batch decrypt to strings.
+    """
+    try:
+        result = pd.Series(
+            ubiq_structured.DecryptDocumentCacheBatch(
+                df[1], merge_caches(df[2]), df[0])
+        )
+        return result
+    except Exception as e:
+        return handle_exceptions(e, df[0])
 
 if __name__ == "__main__":
     fire.Fire(deploy_functions)
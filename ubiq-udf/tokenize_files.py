@@ -0,0 +1,157 @@
+import collections
+import json
+import multiprocessing
+import os
+from typing import Dict
+
+import fire
+import pandas as pd
+import ubiq.structured as ubiq_structured
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pc = None
+    pq = None
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+CSV_EXTENSIONS = (".csv",)
+
+# Dataset engines of the worker process, keyed by dataset name; prepared by
+# init_worker and on first use so every batch a worker handles reuses them
+_worker = {}
+
+def init_worker(ubiq_cache: Dict, columns: Dict[str, str], decrypt: bool):
+    _worker["cache"] = ubiq_cache
+    _worker["columns"] = columns
+    _worker["cipher_class"] = (
+        ubiq_structured.DecryptionWithCache if decrypt
+        else ubiq_structured.EncryptionWithCache
+    )
+    _worker["engines"] = {}
+
+def cipher_batch(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Encrypts or decrypts the mapped columns of a batch, leaving nulls and the
+    other columns unchanged.
+    """
+    engines = _worker["engines"]
+    for column, dataset_name in _worker["columns"].items():
+        if column not in df:
+            raise RuntimeError('Column "%s" not found in input file'%(column))
+        if dataset_name not in engines:
+            engines[dataset_name] = _worker["cipher_class"](dataset_name, _worker["cache"])
+
+        values = df[column]
+        present = values.notna()
+        df[column] = values.astype(object)
+        df.loc[present, column] = [engines[dataset_name].Cipher(str(v)) for v in values[present]]
+    return df
+
+def pipeline(pool, batches, max_pending: int):
+    """
+    Ciphers batches on the pool, yielding results in input order. At most
+    max_pending batches are in flight, so memory stays bounded however large
+    the input is.
+    """
+    pending = collections.deque()
+    for batch in batches:
+        pending.append(pool.apply_async(cipher_batch, (batch,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def tokenize_csv(pool, max_pending, input_path, output_path, batch_size):
+    # Read everything as text so values are ciphered exactly as they appear in
+    # the file; only empty fields are treated as null
+    batches = pd.read_csv(input_path, dtype=str, keep_default_na=False,
+                          na_values=[""], chunksize=batch_size)
+    with open(output_path, "w", newline="") as output:
+        header = True
+        for df in pipeline(pool, batches, max_pending):
+            df.to_csv(output, header=header, index=False)
+            header = False
+
+def tokenize_parquet(pool, max_pending, input_path, output_path, columns, batch_size):
+    if pq is None:
+        raise RuntimeError("Reading and writing Parquet files requires pyarrow")
+
+    source = pq.ParquetFile(input_path)
+    # Ciphered columns are written as strings, whatever their source type
+    schema = source.schema_arrow
+    for column in columns:
+        if column not in schema.names:
+            raise RuntimeError('Column "%s" not found in input file'%(column))
+        schema = schema.set(schema.get_field_index(column), pa.field(column, pa.string()))
+
+    # Mapped columns are cast to text in Arrow, so they are ciphered in the
+    # form Snowflake passes to the UDFs; converted by pandas, a nullable int64
+    # column would become float64 and be ciphered as eg '1234.0'
+    batches = (
+        pa.RecordBatch.from_arrays(
+            [
+                pc.cast(array, pa.string()) if name in columns else array
+                for name, array in zip(batch.schema.names, batch.columns)
+            ],
+            schema=schema,
+        ).to_pandas()
+        for batch in source.iter_batches(batch_size=batch_size)
+    )
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for df in pipeline(pool, batches, max_pending):
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+
+def tokenize_files(
+    cache: str,
+    columns: Dict[str, str],
+    output_dir: str,
+    *inputs: str,
+    decrypt: bool = False,
+    batch_size: int = 10000,
+    processes: int = None,
+):
+    """
+    Encrypts (or decrypts) columns of local Parquet or CSV files with the same
+    structured engine as the Snowflake UDFs, so the results match the UDFs
+    exactly.
+
+    Args:
+        cache: path to a JSON file holding a session cache, as returned by
+            _ubiq_fetch_data_key
+        columns: Ubiq dataset name to cipher each column with, keyed by
+            column name
+        output_dir: directory the output files are written to, under the same
+            file names as the inputs
+        inputs: Parquet (.parquet, .pq) or CSV (.csv) files to process
+        decrypt: decrypt the columns instead of encrypting them
+        batch_size: rows read, ciphered and written at a time
+        processes: number of worker processes (defaults to the number of CPUs)
+    """
+    with open(cache) as f:
+        ubiq_cache = json.load(f)
+
+    processes = processes or os.cpu_count()
+    # Enough batches in flight to keep every worker busy while one is written
+    max_pending = 2 * processes
+
+    os.makedirs(output_dir, exist_ok=True)
+    with multiprocessing.Pool(processes, init_worker, (ubiq_cache, columns, decrypt)) as pool:
+        for input_path in inputs:
+            output_path = os.path.join(output_dir, os.path.basename(input_path))
+            if os.path.abspath(output_path) == os.path.abspath(input_path):
+                raise RuntimeError('Output file "%s" would overwrite its input'%(output_path))
+
+            extension = os.path.splitext(input_path)[1].lower()
+            if extension in PARQUET_EXTENSIONS:
+                tokenize_parquet(pool, max_pending, input_path, output_path, columns, batch_size)
+            elif extension in CSV_EXTENSIONS:
+                tokenize_csv(pool, max_pending, input_path, output_path, batch_size)
+            else:
+                raise RuntimeError('Unsupported file type "%s"'%(input_path))
+
+if __name__ == "__main__":
+    fire.Fire(tokenize_files)
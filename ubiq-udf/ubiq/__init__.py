@@ -1,2 +1,28 @@
-from ubiq.encrypt import encrypt
-from ubiq.decrypt import decrypt
\ No newline at end of file
+import importlib
+
+# Submodules are only imported when one of their names is first used (PEP 562),
+# so importing ubiq.structured does not load the unstructured encryption
+# modules, requests or the cryptography key serialization modules.
+_LAZY_NAMES = {
+    'encrypt': 'ubiq.encrypt',
+    'decrypt': 'ubiq.decrypt',
+}
+
+# Submodules reached as attributes (e.g. ubiq.structured)
+_SUBMODULES = ('structured', 'auth', 'algorithm')
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        value = getattr(importlib.import_module(_LAZY_NAMES[name]), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('ubiq.' + name)
+    else:
+        raise AttributeError("module %r has no attribute %r"%(__name__, name))
+
+    # Importing the submodule binds it under the same name; the function wins,
+    # as it did when these were imported eagerly
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES) | set(_SUBMODULES))
@@ -1,4 +1,59 @@
-from .encrypt import Encryption, Encrypt
-from .decrypt import Decryption, Decrypt
-from .encrypt_cache import EncryptionWithCache, EncryptCache, EncryptCacheBatch, EncryptForSearchCache
-from .decrypt_cache import DecryptionWithCache, DecryptCache, DecryptCacheBatch
\ No newline at end of file
+import importlib
+
+# Names are imported from their submodule when first used (PEP 562), so a UDF
+# handler only loads the modules it calls into
+_LAZY_NAMES = {
+    'Encryption': '.encrypt',
+    'Encrypt': '.encrypt',
+    'Decryption': '.decrypt',
+    'Decrypt': '.decrypt',
+    'EncryptionWithCache': '.encrypt_cache',
+    'EncryptCache': '.encrypt_cache',
+    'EncryptCacheBatch': '.encrypt_cache',
+    'EncryptCacheColumns': '.encrypt_cache',
+    'EncryptForSearchCache': '.encrypt_cache',
+    'EncryptForSearchCacheRows': '.encrypt_cache',
+    'DecryptionWithCache': '.decrypt_cache',
+    'DecryptCache': '.decrypt_cache',
+    'DecryptCacheBatch': '.decrypt_cache',
+    'DecryptCacheColumns': '.decrypt_cache',
+    'DocumentWithCache': '.document_cache',
+    'EncryptDocumentCache': '.document_cache',
+    'EncryptDocumentCacheBatch': '.document_cache',
+    'DecryptDocumentCache': '.document_cache',
+    'DecryptDocumentCacheBatch': '.document_cache',
+    'ReKeyWithCache': '.rekey_cache',
+    'ReKeyCache': '.rekey_cache',
+    'ReKeyCacheBatch': '.rekey_cache',
+    'NumberWithCache': '.number_cache',
+    'NumberEncryptionWithCache': '.number_cache',
+    'NumberDecryptionWithCache': '.number_cache',
+    'EncryptNumberCache': '.number_cache',
+    'EncryptNumberCacheBatch': '.number_cache',
+    'DecryptNumberCache': '.number_cache',
+    'DecryptNumberCacheBatch': '.number_cache',
+    'CipherError': '.stream_cache',
+    'EncryptCacheStream': '.stream_cache',
+    'DecryptCacheStream': '.stream_cache',
+}
+
+# Submodules reached as attributes (e.g. ubiq.structured.common)
+_SUBMODULES = (
+    'common', 'encrypt', 'decrypt', 'encrypt_cache', 'decrypt_cache',
+    'document_cache', 'rekey_cache', 'number_cache', 'stream_cache',
+    'algo',
+)
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        value = getattr(importlib.import_module(_LAZY_NAMES[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError("module %r has no attribute %r"%(__name__, name))
+
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES) | set(_SUBMODULES))
@@ -13,9 +13,30 @@ class Context:
                                radix, alpha)
 
     def cipher(self, X, T, ENC):
+        n = len(X)
+        u = int(n / 2)
+        v = n - u
+
+        nA = ffx.StringToNumber(self.ffx.radix, self.ffx.alpha, X[:u])
+        nB = ffx.StringToNumber(self.ffx.radix, self.ffx.alpha, X[u:])
+
+        nA, nB = self.cipherNumerals(nA, nB, n, T, ENC)
+
+        return (ffx.NumberToString(self.ffx.radix, self.ffx.alpha, nA, u) +
+                ffx.NumberToString(self.ffx.radix, self.ffx.alpha, nB, v))
+
+    def cipherNumber(self, X, n, T, ENC):
+        # X is the numeral of an n digit string in the context's radix,
+        # ciphered without converting to and from the alphabet
+        mV = self.ffx.radix ** (n - int(n / 2))
+
+        nA, nB = self.cipherNumerals(X // mV, X % mV, n, T, ENC)
+
+        return nA * mV + nB
+
+    def cipherNumerals(self, nA, nB, n, T, ENC):
         BLKSZ = self.ffx.BLKSZ
 
-        n = len(X)
         u = int(n / 2)
         v = n - u
 
@@ -52,8 +73,6 @@ class Context:
         # initialize the constant portion of Q
         PQ[BLKSZ:BLKSZ + len(T)] = T
 
-        nA = ffx.StringToNumber(self.ffx.radix, self.ffx.alpha, X[:u])
-        nB = ffx.StringToNumber(self.ffx.radix, self.ffx.alpha, X[u:])
         if not ENC:
             nA, nB = nB, nA
 
@@ -95,11 +114,16 @@ class Context:
         if not ENC:
             nA, nB = nB, nA
 
-        return (ffx.NumberToString(self.ffx.radix, self.ffx.alpha, nA, u) +
-                ffx.NumberToString(self.ffx.radix, self.ffx.alpha, nB, v))
+        return nA, nB
 
     def Encrypt(self, pt, twk = None):
         return self.cipher(pt, twk, True)
 
     def Decrypt(self, ct, twk = None):
         return self.cipher(ct, twk, False)
+
+    def EncryptNumber(self, pt, n, twk = None):
+        return self.cipherNumber(pt, n, twk, True)
+
+    def DecryptNumber(self, ct, n, twk = None):
+        return self.cipherNumber(ct, n, twk, False)
@@ -2,8 +2,6 @@ import base64
 
 from .algo import ffx
 
-import cryptography.hazmat.primitives as crypto
-from cryptography.hazmat.backends import default_backend as crypto_backend
 from typing import Dict, Any, Tuple
 
 def strConvertRadix(s: str, ics: str, ocs: str) -> str:
@@ -82,13 +80,24 @@ def fmtOutput(fmt, s: str, pth: str, rules = []) -> str:
 
     return s
 
-def fetchKey(key: Dict[str, Any], srsa: str) -> str:
-    prvkey = crypto.serialization.load_pem_private_key(
-        key['encrypted_private_key'].encode(), srsa.encode(),
+# The cryptography key modules are imported where keys are unwrapped, so the
+# encrypt and decrypt paths, which only use cached keys, never load them
+def loadPrivateKey(encrypted_private_key: str, srsa: str):
+    import cryptography.hazmat.primitives.serialization
+    import cryptography.hazmat.primitives as crypto
+    from cryptography.hazmat.backends import default_backend as crypto_backend
+
+    return crypto.serialization.load_pem_private_key(
+        encrypted_private_key.encode(), srsa.encode(),
         crypto_backend())
 
+def unwrapKey(prvkey, wrapped_data_key: str) -> str:
+    import cryptography.hazmat.primitives.asymmetric.padding
+    import cryptography.hazmat.primitives.hashes
+    import cryptography.hazmat.primitives as crypto
+
     unwrapped_data_key = prvkey.decrypt(
-        base64.b64decode(key['wrapped_data_key']),
+        base64.b64decode(wrapped_data_key),
         crypto.asymmetric.padding.OAEP(
             mgf=crypto.asymmetric.padding.MGF1(
                 algorithm=crypto.hashes.SHA1()),
@@ -96,3 +105,8 @@ def fetchKey(key: Dict[str, Any], srsa: str) -> str:
             label=None))
 
     return base64.b64encode(unwrapped_data_key).decode()
+
+def fetchKey(key: Dict[str, Any], srsa: str) -> str:
+    prvkey = loadPrivateKey(key['encrypted_private_key'], srsa)
+
+    return unwrapKey(prvkey, key['wrapped_data_key'])
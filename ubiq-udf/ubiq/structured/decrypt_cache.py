@@ -17,6 +17,25 @@ class DecryptionWithCache:
         
         self._dataset = self._cache['ffs']
 
+        if self._dataset['encryption_algorithm'] != 'FF1':
+            raise RuntimeError('unsupported algorithm: ' +
+                                self._dataset['encryption_algorithm'])
+
+        # Contexts are prepared once per key number, on first use, so batches
+        # and streams only pay for each key once
+        self._contexts = {}
+
+    def _context(self, key_number: int) -> ff1.Context:
+        if key_number not in self._contexts:
+            ics = self._dataset['input_character_set']
+            self._contexts[key_number] = ff1.Context(
+                base64.b64decode(self._cache['keys'][key_number]),
+                base64.b64decode(self._dataset['tweak']),
+                self._dataset['tweak_min_len'], self._dataset['tweak_max_len'],
+                len(ics), ics)
+
+        return self._contexts[key_number]
+
     def Cipher(self, ct: str, twk = None) -> str:
         pth = self._dataset['passthrough']
         ics = self._dataset['input_character_set']
@@ -26,21 +45,9 @@ class DecryptionWithCache:
         fmt, ct, rules = fmtInput(ct, pth, ocs, ics, rules)
         ct, n = decKeyNumber(ct, ocs, self._dataset['msb_encoding_bits'])
 
-        key = base64.b64decode(self._cache['keys'][n])
-        
-        if self._dataset['encryption_algorithm'] == 'FF1':
-            self._ctx = ff1.Context(
-                key,
-                base64.b64decode(self._dataset['tweak']),
-                self._dataset['tweak_min_len'], self._dataset['tweak_max_len'],
-                len(ics), ics)
-        else:
-            raise RuntimeError('unsupported algorithm: ' +
-                                self._dataset['encryption_algorithm'])
-        
         ct = strConvertRadix(ct, ocs, ics)
 
-        pt = self._ctx.Decrypt(ct, twk)
+        pt = self._context(n).Decrypt(ct, twk)
 
         return fmtOutput(fmt, pt, pth, rules)
 
@@ -64,3 +71,32 @@ def DecryptCacheBatch(
     
     # Iteratively decrypt all plain text data
     return [decryption.Cipher(cipher_text, twk) for cipher_text in cipher_text_strings]
+
+def DecryptCacheColumns(
+    dataset_names: List[List[str]],
+    ubiq_cache: Dict[str, Any],
+    cipher_text_rows: List[List[str]],
+    twk=None) -> List[List[str]]:
+
+    """
+        For use with the Snowflake Batch API. Each row holds one value per
+        column along with the parallel list of dataset names for those columns.
+    """
+    # Initialize the decryption algorithm once for each dataset in the batch
+    decryptions = {}
+    # Values repeated within the batch are only ciphered once per dataset
+    results = {}
+
+    def cipher(dataset_name, cipher_text):
+        if cipher_text is None:
+            return None
+        if (dataset_name, cipher_text) not in results:
+            if dataset_name not in decryptions:
+                decryptions[dataset_name] = DecryptionWithCache(dataset_name, ubiq_cache)
+            results[(dataset_name, cipher_text)] = decryptions[dataset_name].Cipher(cipher_text, twk)
+        return results[(dataset_name, cipher_text)]
+
+    return [
+        [cipher(dataset_name, cipher_text) for dataset_name, cipher_text in zip(names, row)]
+        for names, row in zip(dataset_names, cipher_text_rows)
+    ]
@@ -0,0 +1,140 @@
+import re
+from typing import Dict, List, Any
+
+from .encrypt_cache import EncryptionWithCache
+from .decrypt_cache import DecryptionWithCache
+
+# Path segment matching any element of an array, eg `phones[*].number`
+ANY_ELEMENT = object()
+
+_PATH_SEGMENT = re.compile(r'\.?([^.\[\]]+)|\[(\d+|\*)\]')
+
+def parsePath(path: str) -> list:
+    # Accepts Snowflake style paths such as `customer.ssn`, `phones[0]` or
+    # `phones[*].number`, optionally prefixed with `$`
+    path = path[1:] if path.startswith('$') else path
+    segments = []
+    pos = 0
+    while pos < len(path):
+        match = _PATH_SEGMENT.match(path, pos)
+        if not match or match.end() == pos:
+            raise RuntimeError('Invalid document path "%s"'%(path))
+        name, index = match.groups()
+        if name is not None:
+            segments.append(name)
+        elif index == '*':
+            segments.append(ANY_ELEMENT)
+        else:
+            segments.append(int(index))
+        pos = match.end()
+
+    if not segments:
+        raise RuntimeError('Invalid document path "%s"'%(path))
+    return segments
+
+class DocumentWithCache:
+    def __init__(self, cipher_class, ubiq_cache: Dict[str, Any], paths: Dict[str, str], ciphers: Dict[str, Any] = None) -> None:
+        self._cipher_class = cipher_class
+        self._cache = ubiq_cache
+        # Dataset engines are prepared on first use and shared by every matching leaf
+        self._ciphers = ciphers if ciphers is not None else {}
+
+        # Merge the paths into a tree so the document is walked only once;
+        # the None key of a node holds the dataset for a leaf at that node
+        self._paths = {}
+        for path, dataset_name in paths.items():
+            node = self._paths
+            for segment in parsePath(path):
+                node = node.setdefault(segment, {})
+            node[None] = dataset_name
+
+    def Cipher(self, document: Any, twk=None) -> Any:
+        return self._rewrite(document, self._paths, twk)
+
+    def _rewrite(self, node: Any, paths: Dict[Any, Any], twk) -> Any:
+        if isinstance(node, dict):
+            updates = {
+                key: self._rewrite(node[key], sub_paths, twk)
+                for key, sub_paths in paths.items()
+                if isinstance(key, str) and key in node
+            }
+            return {**node, **updates} if updates else node
+
+        if isinstance(node, list):
+            result = list(node)
+            for key, sub_paths in paths.items():
+                if key is ANY_ELEMENT:
+                    result = [self._rewrite(element, sub_paths, twk) for element in result]
+                elif isinstance(key, int) and key < len(result):
+                    result[key] = self._rewrite(result[key], sub_paths, twk)
+            return result
+
+        if None in paths:
+            return self._leaf(node, paths[None], twk)
+        return node
+
+    def _leaf(self, value: Any, dataset_name: str, twk) -> Any:
+        if value is None or isinstance(value, bool):
+            return value
+        # Numbers are ciphered as their text, so they decrypt to strings; the
+        # original type is not recorded in the cipher text
+        if dataset_name not in self._ciphers:
+            self._ciphers[dataset_name] = self._cipher_class(dataset_name, self._cache)
+        return self._ciphers[dataset_name].Cipher(str(value), twk)
+
+def _CipherDocumentBatch(
+    cipher_class,
+    paths: List[Dict[str, str]],
+    ubiq_cache: Dict[str, Any],
+    documents: List[Any],
+    twk=None) -> List[Any]:
+
+    # Parse each distinct path mapping once, sharing dataset engines between them
+    ciphers = {}
+    documents_with_cache = {}
+    results = []
+    for row_paths, document in zip(paths, documents):
+        paths_key = tuple(sorted(row_paths.items()))
+        if paths_key not in documents_with_cache:
+            documents_with_cache[paths_key] = DocumentWithCache(cipher_class, ubiq_cache, row_paths, ciphers)
+        results.append(documents_with_cache[paths_key].Cipher(document, twk))
+
+    return results
+
+def EncryptDocumentCache(
+    paths: Dict[str, str],
+    ubiq_cache: Dict[str, Any],
+    document: Any,
+    twk=None) -> Any:
+
+    return DocumentWithCache(EncryptionWithCache, ubiq_cache, paths).Cipher(document, twk)
+
+def EncryptDocumentCacheBatch(
+    paths: List[Dict[str, str]],
+    ubiq_cache: Dict[str, Any],
+    documents: List[Any],
+    twk=None) -> List[Any]:
+
+    """
+        For use with the Snowflake Batch API; paths are given per document
+    """
+    return _CipherDocumentBatch(EncryptionWithCache, paths, ubiq_cache, documents, twk)
+
+def DecryptDocumentCache(
+    paths: Dict[str, str],
+    ubiq_cache: Dict[str, Any],
+    document: Any,
+    twk=None) -> Any:
+
+    return DocumentWithCache(DecryptionWithCache, ubiq_cache, paths).Cipher(document, twk)
+
+def DecryptDocumentCacheBatch(
+    paths: List[Dict[str, str]],
+    ubiq_cache: Dict[str, Any],
+    documents: List[Any],
+    twk=None) -> List[Any]:
+
+    """
+        For use with the Snowflake Batch API; paths are given per document
+    """
+    return _CipherDocumentBatch(DecryptionWithCache, paths, ubiq_cache, documents, twk)
@@ -1,6 +1,5 @@
 import base64
-from typing import Dict, List, Any
-import json
+from typing import Dict, List, Any, Iterable, Tuple
 
 from .algo import ff1
 
@@ -13,17 +12,12 @@ class EncryptionWithCache:
             self._cache = ubiq_cache[dataset_name]
         except KeyError as e:
             raise RuntimeError("Definition for dataset name \"%s\" not found in provided Cache.", dataset_name)
-        # ubiq_get_encrypt_key reduces the cache `.keys` to only contain the current key to cut down on keys transferred
-        if self._cache.get('current_key_only'):
-            self._key = {
-                'key_number': self._cache['current_key_number'],
-                'unwrapped_data_key': base64.b64decode(self._cache["keys"][0])
-            }
-        else:
-            self._key = {
-                'key_number': self._cache['current_key_number'],
-                'unwrapped_data_key': base64.b64decode(self._cache["keys"][int(self._cache['current_key_number'])])
-            }
+        # The encrypt slice built by ubiq_begin_session nulls out every key but the current one,
+        # keeping the remaining key at its key number so full and encrypt-only caches index the same way
+        self._key = {
+            'key_number': self._cache['current_key_number'],
+            'unwrapped_data_key': base64.b64decode(self._cache["keys"][int(self._cache['current_key_number'])])
+        }
 
         self._dataset = self._cache['ffs']
 
@@ -37,6 +31,9 @@ class EncryptionWithCache:
         else:
             raise RuntimeError('unsupported algorithm: ' +
                                self._dataset['encryption_algorithm'])
+
+        # One context per key, prepared on the first search and reused after that
+        self._search_algos = None
     
     def Cipher(self, pt: str, twk=None) -> str:
         pth = self._dataset['passthrough']
@@ -62,7 +59,7 @@ class EncryptionWithCache:
         return fmtOutput(fmt, ct, pth, rules)
     
     def CipherForSearch(self, pt, twk=None) -> list:
-        if self._cache.get('current_key_only'):
+        if not all(self._cache['keys']):
             raise Exception('Encrypting for Search requires more than just the current key. Please check your configuration.')
         
         pth = self._dataset['passthrough']
@@ -79,14 +76,19 @@ class EncryptionWithCache:
         if input_len < input_min or input_len > input_max:
             raise RuntimeError('Invalid input len (%s) min: %s max %s'%(input_len, input_min, input_max))
         
+        if self._search_algos is None:
+            self._search_algos = [
+                ff1.Context(
+                    base64.b64decode(key),
+                    base64.b64decode(self._dataset['tweak']),
+                    self._dataset['tweak_min_len'], self._dataset['tweak_max_len'],
+                    len(ics),
+                    ics)
+                for key in self._cache['keys']
+            ]
+
         searchCipher = []
-        for key_num, key in enumerate(self._cache['keys']):
-            algo = ff1.Context(
-                base64.b64decode(key),
-                base64.b64decode(self._dataset['tweak']),
-                self._dataset['tweak_min_len'], self._dataset['tweak_max_len'],
-                len(ics),
-                ics)
+        for key_num, algo in enumerate(self._search_algos):
             ct = algo.Encrypt(pt, twk)
             ct = strConvertRadix(ct, ics, ocs)
             ct = encKeyNumber(ct, ocs, key_num, self._dataset['msb_encoding_bits'])
@@ -118,6 +120,35 @@ def EncryptCacheBatch(
     # Iteratively encrypt all plain text data
     return [encryption.Cipher(plain_text, twk) for plain_text in plain_text_strings]
 
+def EncryptCacheColumns(
+    dataset_names: List[List[str]],
+    ubiq_cache: Dict[str, Any],
+    plain_text_rows: List[List[str]],
+    twk=None) -> List[List[str]]:
+
+    """
+        For use with the Snowflake Batch API. Each row holds one value per
+        column along with the parallel list of dataset names for those columns.
+    """
+    # Initialize the encryption algorithm once for each dataset in the batch
+    encryptions = {}
+    # Values repeated within the batch are only ciphered once per dataset
+    results = {}
+
+    def cipher(dataset_name, plain_text):
+        if plain_text is None:
+            return None
+        if (dataset_name, plain_text) not in results:
+            if dataset_name not in encryptions:
+                encryptions[dataset_name] = EncryptionWithCache(dataset_name, ubiq_cache)
+            results[(dataset_name, plain_text)] = encryptions[dataset_name].Cipher(plain_text, twk)
+        return results[(dataset_name, plain_text)]
+
+    return [
+        [cipher(dataset_name, plain_text) for dataset_name, plain_text in zip(names, row)]
+        for names, row in zip(dataset_names, plain_text_rows)
+    ]
+
 def EncryptForSearchCache(
         dataset_name: str,
         ubiq_cache: Dict[str, Any],
@@ -126,3 +157,21 @@ def EncryptForSearchCache(
     encryption = EncryptionWithCache(dataset_name, ubiq_cache)
 
     return encryption.CipherForSearch(plain_text, twk)
+
+def EncryptForSearchCacheRows(
+        dataset_name: str,
+        ubiq_cache: Dict[str, Any],
+        rows: Iterable[Tuple[Any, str]],
+        twk=None) -> Iterable[Tuple[Any, int, str]]:
+    """
+        Yields (input_id, key_number, cipher_text) for every key of each
+        (input_id, plain_text) row; repeated plain text is encrypted once
+    """
+    encryption = EncryptionWithCache(dataset_name, ubiq_cache)
+
+    searchCiphers = {}
+    for input_id, plain_text in rows:
+        if plain_text not in searchCiphers:
+            searchCiphers[plain_text] = encryption.CipherForSearch(plain_text, twk)
+        for key_num, ct in enumerate(searchCiphers[plain_text]):
+            yield input_id, key_num, ct
@@ -0,0 +1,206 @@
+import base64
+from typing import Dict, List, Any
+
+from .algo import ff1
+
+# Digits in value order, so a digit's value is its index in a digit-only character set
+DIGITS = '0123456789'
+
+# Widest value that fits in an int64 array; wider datasets fall back to Python integers
+INT64_MAX_DIGITS = 18
+
+class NumberWithCache:
+    """
+        Base for the integer entry points. Only digit-only datasets are supported:
+        both character sets must be leading runs of DIGITS (eg '0123' or
+        '0123456789'), and values are zero padded to the dataset's
+        max_input_length, so a value and its cipher text are the same width.
+    """
+    def __init__(self, dataset_name: str, ubiq_cache: Dict[str, Any]) -> None:
+        try:
+            self._cache = ubiq_cache[dataset_name]
+        except KeyError as e:
+            raise RuntimeError("Definition for dataset name \"%s\" not found in provided Cache.", dataset_name)
+
+        self._dataset = self._cache['ffs']
+
+        if self._dataset['encryption_algorithm'] != 'FF1':
+            raise RuntimeError('unsupported algorithm: ' +
+                               self._dataset['encryption_algorithm'])
+
+        ics = self._dataset['input_character_set']
+        ocs = self._dataset['output_character_set']
+        if not DIGITS.startswith(ics) or not DIGITS.startswith(ocs):
+            raise RuntimeError('Dataset "%s" is not a digit-only dataset'%(dataset_name))
+        self._input_radix = len(ics)
+        self._output_radix = len(ocs)
+
+        # Passthrough characters never occur in an integer; prefix and suffix
+        # rules keep that many leading and trailing digits of the padded value
+        self._prefix = 0
+        self._suffix = 0
+        pth = self._dataset['passthrough']
+        for rule in self._dataset.get('passthrough_rules', []):
+            if rule['type'] == 'passthrough':
+                pth = rule['value']
+            elif rule['type'] == 'prefix':
+                self._prefix += rule['value']
+            elif rule['type'] == 'suffix':
+                self._suffix += rule['value']
+            else:
+                raise RuntimeError('Ubiq Python Library does not support rule type "%s" at this time.'%(rule['type']))
+        if any(c in DIGITS for c in pth):
+            raise RuntimeError('Dataset "%s" passes digits through and is not supported for integers'%(dataset_name))
+
+        self._width = self._dataset['max_input_length']
+        self._digits = self._width - self._prefix - self._suffix
+
+        input_min = self._dataset['min_input_length']
+        input_max = self._dataset['max_input_length']
+        if self._digits < input_min or self._digits > input_max:
+            raise RuntimeError('Invalid input len (%s) min: %s max %s'%(self._digits, input_min, input_max))
+
+        # Contexts are prepared once per key number, on first use
+        self._contexts = {}
+
+    def _context(self, key_number: int) -> ff1.Context:
+        if key_number not in self._contexts:
+            key = self._cache['keys'][key_number] if key_number < len(self._cache['keys']) else None
+            if not key:
+                raise RuntimeError('Key number %s not found in provided Cache.'%(key_number))
+
+            ics = self._dataset['input_character_set']
+            self._contexts[key_number] = ff1.Context(
+                base64.b64decode(key),
+                base64.b64decode(self._dataset['tweak']),
+                self._dataset['tweak_min_len'], self._dataset['tweak_max_len'],
+                len(ics), ics)
+
+        return self._contexts[key_number]
+
+    def _array(self, values):
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.int64 if self._width <= INT64_MAX_DIGITS else object)
+        if ((values < 0) | (values >= 10 ** self._width)).any():
+            raise RuntimeError('Invalid input number, values must be between 0 and %s'%(10 ** self._width - 1))
+        return values
+
+    def _split(self, values):
+        # Every step below is whole-array arithmetic on the decimal digits
+        rest = values % 10 ** (self._width - self._prefix)
+        return (values // 10 ** (self._width - self._prefix),
+                rest // 10 ** self._suffix,
+                rest % 10 ** self._suffix)
+
+    def _join(self, prefix, digits, suffix):
+        return (prefix * 10 ** (self._width - self._prefix) +
+                digits * 10 ** self._suffix +
+                suffix)
+
+    def _toNumerals(self, digits, radix: int):
+        # Reads the decimal digits as a numeral in the given radix
+        if radix == 10:
+            return digits
+        numerals = digits * 0
+        for i in reversed(range(self._digits)):
+            digit = digits // 10 ** i % 10
+            if (digit >= radix).any():
+                raise RuntimeError('Invalid input string character(s)')
+            numerals = numerals * radix + digit
+        return numerals
+
+    def _fromNumerals(self, numerals, radix: int):
+        # Writes a numeral in the given radix out as decimal digits
+        if radix == 10:
+            return numerals
+        digits = numerals * 0
+        for i in range(self._digits):
+            digits = digits + numerals // radix ** i % radix * 10 ** i
+        return digits
+
+    def Cipher(self, value: int, twk=None) -> int:
+        return int(self.CipherArray([value], twk)[0])
+
+class NumberEncryptionWithCache(NumberWithCache):
+    def __init__(self, dataset_name: str, ubiq_cache: Dict[str, Any]) -> None:
+        super().__init__(dataset_name, ubiq_cache)
+        self._key_number = int(self._cache['current_key_number'])
+        self._algo = self._context(self._key_number)
+
+    def CipherArray(self, values, twk=None):
+        import numpy as np
+
+        values = self._array(values)
+        prefix, digits, suffix = self._split(values)
+
+        pt = self._toNumerals(digits, self._input_radix)
+        ct = np.array([self._algo.EncryptNumber(int(x), self._digits, twk) for x in pt], dtype=values.dtype)
+        ct = self._fromNumerals(ct, self._output_radix)
+
+        # Encode the key number in the leading cipher text digit
+        lead = 10 ** (self._digits - 1)
+        shift = self._key_number << self._dataset['msb_encoding_bits']
+        if (ct // lead + shift >= self._output_radix).any():
+            raise RuntimeError('Key number %s cannot be encoded in the output character set'%(self._key_number))
+
+        return self._join(prefix, ct + shift * lead, suffix)
+
+class NumberDecryptionWithCache(NumberWithCache):
+    def CipherArray(self, values, twk=None):
+        import numpy as np
+
+        values = self._array(values)
+        prefix, digits, suffix = self._split(values)
+
+        # Decode the key number from the leading cipher text digit
+        lead = 10 ** (self._digits - 1)
+        msb = self._dataset['msb_encoding_bits']
+        key_numbers = digits // lead >> msb
+        digits = digits - (key_numbers << msb) * lead
+
+        ct = self._toNumerals(digits, self._output_radix)
+        pt = np.array([
+            self._context(int(n)).DecryptNumber(int(x), self._digits, twk)
+            for n, x in zip(key_numbers, ct)
+        ], dtype=values.dtype)
+
+        return self._join(prefix, self._fromNumerals(pt, self._input_radix), suffix)
+
+def EncryptNumberCache(
+    dataset_name: str,
+    ubiq_cache: Dict[str, Any],
+    plain_value: int,
+    twk=None) -> int:
+
+    return NumberEncryptionWithCache(dataset_name, ubiq_cache).Cipher(plain_value, twk)
+
+def EncryptNumberCacheBatch(
+    dataset_name: str,
+    ubiq_cache: Dict[str, Any],
+    plain_values: List[int],
+    twk=None):
+
+    """
+        For use with the Snowflake Batch API; takes and returns NumPy integer arrays
+    """
+    return NumberEncryptionWithCache(dataset_name, ubiq_cache).CipherArray(plain_values, twk)
+
+def DecryptNumberCache(
+    dataset_name: str,
+    ubiq_cache: Dict[str, Any],
+    cipher_value: int,
+    twk=None) -> int:
+
+    return NumberDecryptionWithCache(dataset_name, ubiq_cache).Cipher(cipher_value, twk)
+
+def DecryptNumberCacheBatch(
+    dataset_name: str,
+    ubiq_cache: Dict[str, Any],
+    cipher_values: List[int],
+    twk=None):
+
+    """
+        For use with the Snowflake Batch API; takes and returns NumPy integer arrays
+    """
+    return NumberDecryptionWithCache(dataset_name, ubiq_cache).CipherArray(cipher_values, twk)
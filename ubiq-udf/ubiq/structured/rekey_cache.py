@@ -0,0 +1,85 @@
+import base64
+from typing import Dict, List, Any
+
+from .algo import ff1
+
+from .common import fmtInput, strConvertRadix, encKeyNumber, decKeyNumber, fmtOutput
+
+class ReKeyWithCache:
+    def __init__(self, dataset_name: str, ubiq_cache: Dict[str, Any]) -> None:
+        try:
+            self._cache = ubiq_cache[dataset_name]
+        except KeyError as e:
+            raise RuntimeError("Definition for dataset name \"%s\" not found in provided Cache.", dataset_name)
+
+        self._dataset = self._cache['ffs']
+        self._current_key_number = int(self._cache['current_key_number'])
+
+        if self._dataset['encryption_algorithm'] != 'FF1':
+            raise RuntimeError('unsupported algorithm: ' +
+                               self._dataset['encryption_algorithm'])
+
+        # Contexts are prepared once per key number, on first use
+        self._contexts = {}
+
+    def _context(self, key_number: int) -> ff1.Context:
+        if key_number not in self._contexts:
+            key = self._cache['keys'][key_number] if key_number < len(self._cache['keys']) else None
+            if not key:
+                raise RuntimeError('Key number %s not found in provided Cache.'%(key_number))
+
+            ics = self._dataset['input_character_set']
+            self._contexts[key_number] = ff1.Context(
+                base64.b64decode(key),
+                base64.b64decode(self._dataset['tweak']),
+                self._dataset['tweak_min_len'], self._dataset['tweak_max_len'],
+                len(ics), ics)
+
+        return self._contexts[key_number]
+
+    def Cipher(self, ct: str, twk=None) -> str:
+        pth = self._dataset['passthrough']
+        ics = self._dataset['input_character_set']
+        ocs = self._dataset['output_character_set']
+        msb = self._dataset['msb_encoding_bits']
+        rules = self._dataset.get('passthrough_rules', [])
+
+        fmt, trm, rules = fmtInput(ct, pth, ocs, ics, rules)
+        trm, n = decKeyNumber(trm, ocs, msb)
+
+        # Already protected with the current key
+        if n == self._current_key_number:
+            return ct
+
+        # Decrypt with the old key and encrypt with the current one while still
+        # in the input character set; the format is the same on both sides
+        trm = strConvertRadix(trm, ocs, ics)
+        pt = self._context(n).Decrypt(trm, twk)
+        trm = self._context(self._current_key_number).Encrypt(pt, twk)
+        trm = strConvertRadix(trm, ics, ocs)
+        trm = encKeyNumber(trm, ocs, self._current_key_number, msb)
+
+        return fmtOutput(fmt, trm, pth, rules)
+
+def ReKeyCache(
+    dataset_name: str,
+    ubiq_cache: Dict[str, Any],
+    cipher_text: str,
+    twk=None) -> str:
+
+    return ReKeyWithCache(dataset_name, ubiq_cache).Cipher(cipher_text, twk)
+
+def ReKeyCacheBatch(
+    dataset_name: str,
+    ubiq_cache: Dict[str, Any],
+    cipher_text_strings: List[str],
+    twk=None) -> List[str]:
+
+    """
+        For use with the Snowflake Batch API
+    """
+    # Initialize the re-key algorithm for the given Dataset and Keys
+    rekey = ReKeyWithCache(dataset_name, ubiq_cache)
+
+    # Iteratively re-key all cipher text data
+    return [None if cipher_text is None else rekey.Cipher(cipher_text, twk) for cipher_text in cipher_text_strings]
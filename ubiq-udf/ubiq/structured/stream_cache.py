@@ -0,0 +1,84 @@
+import itertools
+from typing import Dict, Iterable, Iterator, Any
+
+from .encrypt_cache import EncryptionWithCache
+from .decrypt_cache import DecryptionWithCache
+
+DEFAULT_CHUNK_SIZE = 10000
+
+class CipherError:
+    """
+        Yielded in place of the result for an item that could not be encrypted
+        or decrypted, so one bad value does not end the stream
+    """
+    def __init__(self, index: int, value: Any, error: Exception) -> None:
+        self.index = index
+        self.value = value
+        self.error = error
+
+    def __repr__(self) -> str:
+        return 'CipherError(index=%s, error=%r)'%(self.index, self.error)
+
+def _CipherStream(
+    engine,
+    values: Iterable[str],
+    chunk_size: int,
+    twk) -> Iterator[Any]:
+
+    values = iter(values)
+    index = 0
+    while True:
+        chunk = list(itertools.islice(values, chunk_size))
+        if not chunk:
+            return
+
+        # Values repeated within a chunk are only ciphered once
+        results = {}
+        for value in chunk:
+            if value is None:
+                yield None
+            else:
+                if value not in results:
+                    try:
+                        results[value] = engine.Cipher(value, twk)
+                    except Exception as e:
+                        results[value] = e
+                result = results[value]
+                yield CipherError(index, value, result) if isinstance(result, Exception) else result
+            index += 1
+
+def EncryptCacheStream(
+    dataset_name: str,
+    ubiq_cache: Dict[str, Any],
+    plain_text_strings: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    twk=None) -> Iterator[Any]:
+
+    """
+        Lazily encrypts any iterable of plain text, holding at most chunk_size
+        values at a time. Yields the cipher text, None for None, or a
+        CipherError for each value, in input order.
+    """
+    # Initialize the algorithm up front so configuration errors are raised
+    # here rather than on the first item, and once for the whole stream
+    encryption = EncryptionWithCache(dataset_name, ubiq_cache)
+
+    return _CipherStream(encryption, plain_text_strings, chunk_size, twk)
+
+def DecryptCacheStream(
+    dataset_name: str,
+    ubiq_cache: Dict[str, Any],
+    cipher_text_strings: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    twk=None) -> Iterator[Any]:
+
+    """
+        Lazily decrypts any iterable of cipher text, holding at most chunk_size
+        values at a time. Yields the plain text, None for None, or a
+        CipherError for each value, in input order.
+    """
+    # Initialize the algorithm up front so configuration errors are raised
+    # here rather than on the first item, and once for the whole stream
+    decryption = DecryptionWithCache(dataset_name, ubiq_cache)
+
+    return _CipherStream(decryption, cipher_text_strings, chunk_size, twk)
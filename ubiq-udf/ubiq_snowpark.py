@@ -0,0 +1,77 @@
+from typing import Dict
+from snowflake.snowpark import DataFrame
+from snowflake.snowpark.functions import array_construct, call_function, col, get, lit, object_agg
+from snowflake.snowpark.types import StringType
+
+# Working columns added while protecting a DataFrame; dropped from the result
+CACHE_COLUMN = "_UBIQ_CACHE"
+RESULT_COLUMN = "_UBIQ_RESULT"
+
+def protect(df: DataFrame, columns: Dict[str, str]) -> DataFrame:
+    """
+    Encrypts columns of a Snowpark DataFrame, eg
+    protect(df, {"ssn": "SSN", "dob": "BIRTH_DATE"})
+
+    Every column is encrypted by a single call of the vectorized
+    _ubiq_encrypt_columns_batch UDF per row, with the datasets' cache slices
+    joined once from the session cache rather than looked up per row. Requires
+    ubiq_begin_session to have been called in the DataFrame's session.
+
+    Args:
+        df: the DataFrame to protect
+        columns: Ubiq dataset name to encrypt each column with, keyed by
+            column name
+    Returns:
+        The DataFrame with the given columns encrypted, in their original
+        positions.
+    """
+    return cipher_columns(df, columns, "_ubiq_encrypt_columns_batch", "encrypt_cache")
+
+def unprotect(df: DataFrame, columns: Dict[str, str]) -> DataFrame:
+    """
+    Decrypts columns of a Snowpark DataFrame protected by protect or the
+    ubiq_encrypt functions, eg unprotect(df, {"ssn": "SSN", "dob": "BIRTH_DATE"})
+
+    Args:
+        df: the DataFrame to unprotect
+        columns: Ubiq dataset name to decrypt each column with, keyed by
+            column name
+    Returns:
+        The DataFrame with the given columns decrypted, in their original
+        positions.
+    """
+    return cipher_columns(df, columns, "_ubiq_decrypt_columns_batch", "decrypt_cache")
+
+def cipher_columns(df: DataFrame, columns: Dict[str, str], udf_name: str, cache_column: str) -> DataFrame:
+    # Match the given names to the DataFrame's, which Snowpark normalizes
+    names = {column_name(name): dataset_name for name, dataset_name in columns.items()}
+    missing = [name for name in names if name not in df.columns]
+    if missing:
+        raise ValueError("Columns not found in DataFrame: %s" % ", ".join(missing))
+    positions = {name: i for i, name in enumerate(names)}
+
+    # A single row holding the slice of every dataset used, keyed by dataset
+    # name, in the shape the multi-column UDFs expect
+    caches = (
+        df.session.table("ubiq_cache")
+        .filter(col("dataset_name").isin(sorted(set(names.values()))))
+        .select(object_agg(col("dataset_name"), get(col(cache_column), col("dataset_name"))).alias(CACHE_COLUMN))
+    )
+
+    result = call_function(
+        udf_name,
+        array_construct(*[lit(dataset_name) for dataset_name in names.values()]),
+        array_construct(*[col(name) for name in names]),
+        col(CACHE_COLUMN),
+    )
+
+    # Repeated values of a batch are only ciphered once by the UDF
+    ciphered = df.join(caches, how="cross").with_column(RESULT_COLUMN, result)
+    return ciphered.select([
+        col(RESULT_COLUMN)[positions[name]].cast(StringType()).alias(name) if name in positions else col(name)
+        for name in df.columns
+    ])
+
+def column_name(name: str) -> str:
+    # Snowflake identifiers are case insensitive unless quoted
+    return name if name.startswith('"') else name.upper()
@@ -1,3 +1,6 @@
+-- Run deploy_udfs.py before this script: the functions below call the UDFs and the
+-- _ubiq_encrypt_cache / _ubiq_decrypt_cache(s) helpers it creates.
+
 create or replace table ubiq_creds (
     access_key_id varchar(24),
     secret_signing_key varchar(44),
@@ -5,19 +8,26 @@ create or replace table ubiq_creds (
 );
 
 
+-- Encrypt-only view of a cache: every key except the current one is nulled out,
+-- so keys stay indexed by key number. Evaluated once per dataset by ubiq_begin_session.
 create or replace function _ubiq_get_encrypt_key("cache" object)
 returns object
 language javascript
 as '
     for(const dataset_def in cache){
-        cache[dataset_def].keys = [cache[dataset_def].keys[cache[dataset_def].current_key_number]];
-        cache[dataset_def].current_key_only = true;
+        const current_key_number = cache[dataset_def].current_key_number;
+        cache[dataset_def].keys = cache[dataset_def].keys.map(
+            (key, key_number) => key_number == current_key_number ? key : null
+        );
     }
     
     return cache
 ';
 
-create or replace temporary table ubiq_cache (cache object);
+-- The wrappers read the session cache through _ubiq_encrypt_cache / _ubiq_decrypt_cache,
+-- which deploy_udfs.py creates. They are not MEMOIZABLE, as they read the session's
+-- temporary ubiq_cache table.
+-- Each returns a single dataset's slice, an object keyed by that dataset's name.
 
 create or replace function ubiq_encrypt("dataset_name" varchar, "plain_text" varchar)
 returns varchar
@@ -27,7 +37,7 @@ $$
 select _ubiq_encrypt(
     dataset_name,
     plain_text,
-    (select _ubiq_get_encrypt_key(cache) from ubiq_cache)
+    _ubiq_encrypt_cache(dataset_name)
 )
 $$;
 
@@ -40,7 +50,7 @@ $$
 select _ubiq_encrypt_for_search_array(
     dataset_name,
     plain_text, 
-    (select cache from ubiq_cache)
+    _ubiq_decrypt_cache(dataset_name)
 )
 $$;
 
@@ -55,7 +65,7 @@ from
         _ubiq_encrypt_for_search_table(
             dataset_name, 
             plain_text, 
-            (select cache from ubiq_cache)
+            _ubiq_decrypt_cache(dataset_name)
         )
     )
 $$;
@@ -68,29 +78,225 @@ $$
 select _ubiq_decrypt(
     dataset_name,
     cipher_text,
-    (select cache from ubiq_cache)
+    _ubiq_decrypt_cache(dataset_name)
+)
+$$;
+
+
+-- Re-encrypts cipher text with the dataset's current key after a key rotation;
+-- values already on the current key are returned unchanged
+create or replace function ubiq_rekey("dataset_name" varchar, "cipher_text" varchar)
+returns varchar
+language sql
+as
+$$
+select _ubiq_rekey_batch(
+    dataset_name,
+    cipher_text,
+    _ubiq_decrypt_cache(dataset_name)
 )
 $$;
 
-drop table ubiq_cache;
+-- Encrypts a NUMBER column of a digit-only dataset without casting it to a string,
+-- eg account or member numbers; values are zero padded to the dataset's maximum length
+create or replace function ubiq_encrypt_number("dataset_name" varchar, "plain_value" number)
+returns number
+language sql
+as
+$$
+select _ubiq_encrypt_number_batch(
+    dataset_name,
+    plain_value,
+    _ubiq_encrypt_cache(dataset_name)
+)
+$$;
 
+create or replace function ubiq_decrypt_number("dataset_name" varchar, "cipher_value" number)
+returns number
+language sql
+as
+$$
+select _ubiq_decrypt_number_batch(
+    dataset_name,
+    cipher_value,
+    _ubiq_decrypt_cache(dataset_name)
+)
+$$;
+
+-- Encrypts several columns of a row in one call, eg
+-- ubiq_encrypt_columns(array_construct('SSN', 'BIRTH_DATE'), array_construct(ssn, birth_date))
+-- Returns an Array of cipher texts in the same order as the given values
+create or replace function ubiq_encrypt_columns("dataset_names" array, "plain_texts" array)
+returns array
+language sql
+as
+$$
+select _ubiq_encrypt_columns_batch(
+    dataset_names,
+    plain_texts,
+    _ubiq_encrypt_caches(dataset_names)
+)
+$$;
+
+create or replace function ubiq_decrypt_columns("dataset_names" array, "cipher_texts" array)
+returns array
+language sql
+as
+$$
+select _ubiq_decrypt_columns_batch(
+    dataset_names,
+    cipher_texts,
+    _ubiq_decrypt_caches(dataset_names)
+)
+$$;
+
+-- Encrypts the columns of a row object that are mapped to a dataset, eg
+-- ubiq_encrypt_object({'ssn': 'SSN', 'dob': 'BIRTH_DATE'}, object_construct(*))
+-- Returns the row object with the mapped columns encrypted
+create or replace function ubiq_encrypt_object("dataset_map" object, "row_values" object)
+returns object
+language sql
+as
+$$
+select _ubiq_encrypt_object_batch(
+    dataset_map,
+    row_values,
+    _ubiq_encrypt_caches((select array_agg(f.value) from table(flatten(input => dataset_map)) f))
+)
+$$;
+
+create or replace function ubiq_decrypt_object("dataset_map" object, "row_values" object)
+returns object
+language sql
+as
+$$
+select _ubiq_decrypt_object_batch(
+    dataset_map,
+    row_values,
+    _ubiq_decrypt_caches((select array_agg(f.value) from table(flatten(input => dataset_map)) f))
+)
+$$;
+
+-- Encrypts the values at the given paths of a VARIANT document, eg
+-- ubiq_encrypt_document(payload, {'customer.ssn': 'SSN', 'phones[*].number': 'PHONE'})
+-- Returns the document with those values encrypted
+create or replace function ubiq_encrypt_document("document" variant, "paths" object)
+returns variant
+language sql
+as
+$$
+select _ubiq_encrypt_document_batch(
+    document,
+    paths,
+    _ubiq_encrypt_caches((select array_agg(f.value) from table(flatten(input => paths)) f))
+)
+$$;
+
+create or replace function ubiq_decrypt_document("document" variant, "paths" object)
+returns variant
+language sql
+as
+$$
+select _ubiq_decrypt_document_batch(
+    document,
+    paths,
+    _ubiq_decrypt_caches((select array_agg(f.value) from table(flatten(input => paths)) f))
+)
+$$;
 
 -- Creates Cache with unwrapped keys; no Secret Crypto Key needed for enc/dec functions.
+-- Each dataset gets its own row so the wrappers only pass the slice they need;
+-- the encrypt slice only carries the current key.
 create or replace procedure ubiq_begin_session("dataset_name" varchar, "access_key" varchar, "secret_signing_key" varchar, "secret_crypto_access_key" varchar)
 returns varchar
 language javascript
 as
 $$
-    var sql = `create or replace temporary table ubiq_cache (cache object) as 
-        select _ubiq_fetch_data_key(
-            '${dataset_name}',
-            '${secret_crypto_access_key}',
-            (select _ubiq_broker_fetch_dataset_and_structured_key( 
+    var sql = `create or replace temporary table ubiq_cache (dataset_name varchar, encrypt_cache object, decrypt_cache object) as 
+        with session_cache as (
+            select _ubiq_fetch_data_key(
+                '${dataset_name}',
+                '${secret_crypto_access_key}',
+                (select _ubiq_broker_fetch_dataset_and_structured_key( 
+                    '${dataset_name}',
+                    '${access_key}', 
+                    '${secret_signing_key}'
+                ))
+            ) as cache
+        )
+        select
+            f.key,
+            _ubiq_get_encrypt_key(object_construct(f.key, f.value)),
+            object_construct(f.key, f.value)
+        from session_cache, lateral flatten(input => session_cache.cache) f;`
+    try {
+        snowflake.execute({sqlText: sql});
+        return "Succeeded"
+    }
+    catch (err) {
+        return "Failed: " + err;
+    }
+$$;
+
+-- Picks up rotated keys and additional datasets without rebuilding the session cache.
+-- The broker omits the keys the session already holds, so only new key generations
+-- (and datasets not yet in the session) are unwrapped and merged into ubiq_cache.
+create or replace procedure ubiq_refresh_session("dataset_name" varchar, "access_key" varchar, "secret_signing_key" varchar, "secret_crypto_access_key" varchar)
+returns varchar
+language javascript
+as
+$$
+    var sql = `insert overwrite into ubiq_cache 
+        with session_cache as (
+            select _ubiq_refresh_data_key(
+                '${dataset_name}',
+                '${secret_crypto_access_key}',
+                (select _ubiq_broker_refresh_dataset_and_structured_key( 
+                    '${dataset_name}',
+                    '${access_key}', 
+                    '${secret_signing_key}',
+                    (select object_agg(c.dataset_name, array_size(get(c.decrypt_cache, c.dataset_name):keys)::variant) from ubiq_cache c)
+                )),
+                (select object_agg(c.dataset_name, get(c.decrypt_cache, c.dataset_name)) from ubiq_cache c)
+            ) as cache
+        )
+        select
+            f.key,
+            _ubiq_get_encrypt_key(object_construct(f.key, f.value)),
+            object_construct(f.key, f.value)
+        from session_cache, lateral flatten(input => session_cache.cache) f;`
+    try {
+        snowflake.execute({sqlText: sql});
+        return "Succeeded"
+    }
+    catch (err) {
+        return "Failed: " + err;
+    }
+$$;
+
+-- Materializes the encrypt-for-search cipher texts of a set of probe values into
+-- index_table (plaintext_hash, key_number, cipher_text) in one batched pass.
+-- probe_query is any query whose first column holds the plain text values, eg
+-- 'select ssn from customers' or 'select column1 from values (''123-45-6789''), (''987-65-4321'')'.
+-- Lookups and joins against encrypted columns then become ordinary equi-joins on cipher_text.
+create or replace procedure ubiq_build_search_index("dataset_name" varchar, "probe_query" varchar, "index_table" varchar)
+returns varchar
+language javascript
+as
+$$
+    var sql = `create or replace table ${index_table} (plaintext_hash varchar, key_number number, cipher_text varchar) as 
+        select
+            t.input_id,
+            t.key_number,
+            t.cipher_text
+        from
+            (select distinct $1::varchar as plain_text from (${probe_query})) p,
+            table(_ubiq_encrypt_for_search_partition(
+                sha2(p.plain_text, 256),
                 '${dataset_name}',
-                '${access_key}', 
-                '${secret_signing_key}'
-            ))
-        );`
+                p.plain_text,
+                _ubiq_decrypt_cache('${dataset_name}')
+            )) t;`
     try {
         snowflake.execute({sqlText: sql});
         return "Succeeded"